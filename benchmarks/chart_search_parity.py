@@ -0,0 +1,103 @@
+"""Checks that the chart search index finds the same charts as the LIKE query
+it replaced, on the configured database.
+
+Run from the repository root: python -m benchmarks.chart_search_parity [keyword ...]
+"""
+
+import re
+import sys
+
+from src.config import DATABASE_CONFIG
+from src.database import DatabaseConnection
+from src.tools.ngrams import fold
+
+# Inputs the server collation (Korean_Wansung_CI_AS) folds beyond case:
+# full width Latin, half width katakana and katakana against hiragana.
+KEYWORDS = (
+    "love",
+    "LOVE",
+    "ＬＯＶＥ",
+    "ｌｏｖｅ",
+    "ラブ",
+    "らぶ",
+    "ﾗﾌﾞ",
+    "ドリーム",
+    "どりーむ",
+    "사랑",
+    "",
+)
+
+OPTIONS = {"level": [0, 180], "title": True, "artist": True, "mapper": True}
+
+# Pairs the index must treat as equal, checked without a database.
+FOLDED_PAIRS = (
+    ("ＡＢＣ", "abc"),
+    ("ｶﾀｶﾅ", "かたかな"),
+    ("カタカナ", "かたかな"),
+    ("ヴ", "ゔ"),
+)
+
+
+def escape_like(keyword):
+    # Same escaping as the LIKE query did.
+    def escape_brackets(match):
+        return "[" + "".join(f"[{c}]" for c in match.group(1)) + "]"
+
+    keyword = re.sub(r"\[([^\]]+)\]", escape_brackets, keyword)
+    return keyword.replace("%", "[%]").replace("_", "[_]")
+
+
+def like_search(connection, keyword):
+    # The query the index replaced, restricted to the charts' music codes.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT meta.MusicCode
+            FROM dbo.o2jam_music_metadata meta
+                     RIGHT OUTER JOIN (SELECT MusicCode, NoteLevel
+                                       FROM dbo.o2jam_music_data
+                                       WHERE Difficulty = 2) data ON data.MusicCode = meta.MusicCode
+            WHERE data.NoteLevel BETWEEN ? AND ?
+              AND (Title LIKE ? OR Artist LIKE ? OR NoteCharter LIKE ?)
+            """,
+            [*OPTIONS["level"], *[f"%{escape_like(keyword)}%"] * 3],
+        )
+
+        return {row[0] for row in cursor.fetchall()}
+
+
+def main(keywords):
+    failures = 0
+
+    for text, folded in FOLDED_PAIRS:
+        if fold(text) != fold(folded):
+            print(f"fold mismatch: {text!r} -> {fold(text)!r}, {folded!r} -> {fold(folded)!r}")
+            failures += 1
+
+    database = DatabaseConnection(DATABASE_CONFIG)
+
+    try:
+        for keyword in keywords:
+            expected = like_search(database.utils._connection, keyword)
+            found = {
+                entry.music_code
+                for entry in database.utils.search_chart(
+                    {"keywords": keyword, "options": OPTIONS}
+                )
+            }
+
+            status = "ok" if found == expected else "MISMATCH"
+            failures += found != expected
+
+            print(
+                f"{status:<8} {keyword!r:<12} like={len(expected):5} index={len(found):5} "
+                f"missing={sorted(expected - found)[:10]} extra={sorted(found - expected)[:10]}"
+            )
+    finally:
+        database.close()
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:] or KEYWORDS))
@@ -0,0 +1,140 @@
+"""Compares loading a player profile one statement at a time against the
+single multi-result-set batch of InfoManager.get_player_info.
+
+A stand-in cursor answers every statement after a simulated round trip, so
+the difference is what the batch saves per profile on a remote server.
+
+Run from the repository root: python -m benchmarks.player_profile [round trip ms]
+"""
+
+import datetime
+import sys
+import time
+from contextlib import contextmanager
+
+from src.database.info_manager import InfoManager
+from src.database.ranking_index import player_ranking_index
+
+REPEAT = 50
+
+# Result set of each part of the profile, by a text only its statement has.
+RESULT_SETS = {
+    "USER_NICKNAME": [("player", 30, 1200, 0, 1, datetime.datetime(2025, 1, 1))],
+    "COUNT(*)": [(250,)],
+    "dbo.nickname_history": [("old name",), ("older name",)],
+    "dbo.player_badge": [("badge", "badge-css", 100)],
+    "status_clear_history": [
+        (f"2025-01-{day:02d}", 200 + day) for day in range(1, 31)
+    ],
+    "RANK()": [(10,)],
+    "TIES": [(2,)],
+}
+
+# The profile as it was read before the batch, seven statements.
+STATEMENTS = (
+    "SELECT USER_NICKNAME, Level, Battle, AdminLevel, USER_INDEX_ID, LastAccess ...",
+    "SELECT COUNT(*) FROM dbo.O2JamHighscore ...",
+    "SELECT Nickname FROM dbo.nickname_history ...",
+    "SELECT ... FROM dbo.player_badge ...",
+    "SELECT ... FROM status_clear_history ...",
+    "SELECT RANK() ... FROM dbo.O2JamStatus ...",
+    "SELECT TIES ... FROM dbo.O2JamStatus ...",
+)
+
+
+class StandInCursor:
+    def __init__(self, round_trip):
+        self._round_trip = round_trip
+        self._result_sets = []
+        self._rows = []
+
+    def execute(self, sql, *params):
+        time.sleep(self._round_trip)
+
+        # A batch returns one result set per statement, in order.
+        found = sorted(
+            (sql.index(marker), rows)
+            for marker, rows in RESULT_SETS.items()
+            if marker in sql
+        )
+        self._result_sets = [list(rows) for _, rows in found]
+        self.nextset()
+
+        return self
+
+    def nextset(self):
+        if not self._result_sets:
+            self._rows = []
+            return False
+
+        self._rows = self._result_sets.pop(0)
+        return True
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchval(self):
+        row = self.fetchone()
+        return row[0] if row is not None else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+
+class _NoMemo:
+    # Every call measured runs its queries.
+    def get(self, key, load):
+        return load()
+
+
+class StandInConnection:
+    def __init__(self, round_trip):
+        self._round_trip = round_trip
+        self.memo = _NoMemo()
+
+    def cursor(self):
+        return StandInCursor(self._round_trip)
+
+    @contextmanager
+    def execute(self, sql, params=()):
+        yield self.cursor().execute(sql, params)
+
+
+def load_per_statement(connection):
+    results = []
+
+    for statement in STATEMENTS:
+        cursor = connection.cursor().execute(statement, 1)
+        results.append(cursor.fetchall())
+
+    return results
+
+
+def load_batch(connection):
+    return InfoManager(connection).get_player_info(1, 2)
+
+
+def measure(name, load, connection):
+    # Rank and ties come from the in-memory index, kept fresh for the run.
+    player_ranking_index._built_at = player_ranking_index._refreshed_at = (
+        time.monotonic()
+    )
+
+    started = time.perf_counter()
+
+    for _ in range(REPEAT):
+        load(connection)
+
+    seconds = (time.perf_counter() - started) / REPEAT
+
+    print(f"{name:<14} {seconds * 1000:8.2f} ms/profile")
+
+
+if __name__ == "__main__":
+    round_trip_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    connection = StandInConnection(round_trip_ms / 1000)
+
+    print(f"round trip {round_trip_ms} ms, {REPEAT} profiles")
+    measure("per statement", load_per_statement, connection)
+    measure("batch", load_batch, connection)
@@ -0,0 +1,121 @@
+"""Compares building scoreboard rows as dicts against the record mappers.
+
+Run from the repository root: python -m benchmarks.record_mapping
+"""
+
+import datetime
+import timeit
+import tracemalloc
+
+from src.database.player_ranking_manager import TOP_RECORD_MAPPER
+from src.database.ranking_index import song_rank_index
+from src.database.reference_catalog import _CatalogData, reference_catalog
+
+ROW_COUNT = 10000
+REPEAT = 20
+
+# Code-only rows as PLAYER_TOP_RECORDS returns them, the names are filled in
+# from the reference catalog seeded below.
+ROWS = [
+    (
+        1,
+        music_code,
+        2,
+        music_code % 120,
+        900000,
+        1000,
+        10,
+        1,
+        0,
+        1011,
+        music_code % 10,
+        True,
+        datetime.datetime(2025, 1, 1, 12, 0),
+        0,
+        1.0,
+        0,
+        0,
+        0,
+        False,
+        music_code + 1,
+    )
+    for music_code in range(ROW_COUNT)
+]
+
+
+def seed_catalog():
+    reference_catalog._swap(
+        _CatalogData(
+            {
+                music_code: (f"Title {music_code}", "Artist", "Charter", 120)
+                for music_code in range(ROW_COUNT)
+            },
+            {
+                (music_code, 2): (music_code % 120, 1000)
+                for music_code in range(ROW_COUNT)
+            },
+            {progress: f"Progress {progress}" for progress in range(10)},
+            {},
+            {},
+        ),
+        {},
+        None,
+        0.0,
+    )
+
+
+def build_dicts(rows, row_offset=0):
+    # Row to dict conversion as the managers did it before the mappers.
+    return [
+        {
+            "player_code": record[0],
+            "music_code": record[1],
+            "music_title": reference_catalog.title(record[1]),
+            "music_difficulty": record[2],
+            "music_level": record[3],
+            "score": record[4],
+            "score_cool": record[5],
+            "score_good": record[6],
+            "score_bad": record[7],
+            "score_miss": record[8],
+            "score_max_combo": record[9],
+            "progress": reference_catalog.progress_name(record[10]),
+            "is_cleared_record": record[11],
+            "cleared_time": record[12],
+            "record_rank": song_rank_index.rank(record[1], record[2], record[4]),
+            "pattern_order": record[13],
+            "play_speed_rate": float(record[14]) if record[14] is not None else None,
+            "play_timing_rate": record[15],
+            "fln_option": record[16],
+            "sln_option": record[17],
+            "is_nln": record[18],
+            "row_number": record[19] + row_offset,
+        }
+        for record in rows
+    ]
+
+
+def build_records(rows, row_offset=0):
+    return TOP_RECORD_MAPPER.map_rows(rows, row_offset=row_offset)
+
+
+def measure(name, build):
+    seconds = min(timeit.repeat(lambda: build(ROWS), number=1, repeat=REPEAT))
+
+    tracemalloc.start()
+    result = build(ROWS)
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del result
+
+    print(
+        f"{name:<8} {seconds * 1000:8.2f} ms "
+        f"{allocated / ROW_COUNT:8.1f} bytes/row ({ROW_COUNT} rows)"
+    )
+
+
+if __name__ == "__main__":
+    seed_catalog()
+    measure("dict", build_dicts)
+    measure("record", build_records)
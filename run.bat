@@ -1,2 +1,2 @@
 @echo off
-start /b poetry run waitress-serve --host 127.0.0.1 --port 10443 src.app:app
\ No newline at end of file
+start /b poetry run waitress-serve --host 127.0.0.1 --port 10443 --threads 8 src.app:app
\ No newline at end of file
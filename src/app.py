@@ -6,6 +6,9 @@ from src.controller.api import api
 from src.controller.redirection import redirection
 from src.controller.scoreboard import scoreboard
 from src.controller.troubleshoot import troubleshoot
+from src.database.executor import QueryDeadlineExceeded
+from src.database.pool import PoolTimeoutError
+from src.tools.presentation import register_filters
 
 app = Flask(__name__)
 
@@ -14,7 +17,23 @@ app.register_blueprint(redirection)
 app.register_blueprint(troubleshoot)
 app.register_blueprint(scoreboard)
 
-CORS(app, resources={r"/api/*": {"origins": CORS_ORIGINS}})
+register_filters(app)
+
+CORS(
+    app,
+    resources={r"/api/*": {"origins": CORS_ORIGINS}},
+    expose_headers=["X-Next-Cursor", "ETag"],
+)
+
+
+@app.errorhandler(PoolTimeoutError)
+def database_busy(_):
+    return "Server is busy, try again later.", 503
+
+
+@app.errorhandler(QueryDeadlineExceeded)
+def database_timeout(_):
+    return "Server took too long to respond, try again later.", 504
 
 
 @app.route("/robots.txt")
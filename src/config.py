@@ -31,8 +31,56 @@ DATABASE_CONFIG = {
         UID={get_env_var("DB_USER")};
         PWD={get_env_var("DB_PASSWORD")};
         TrustServerCertificate=yes;""",
+    # Connection pool shared by every request thread, one pool per database.
+    # Size it above waitress threads (--threads in run.bat and the Dockerfile)
+    # so fan-out queries started by a request can still borrow connections.
+    "pool": {
+        "pool_size": int(get_env_var("DB_POOL_SIZE", "12")),
+        "checkout_timeout": float(get_env_var("DB_POOL_TIMEOUT", "10")),
+        "ping_interval": float(get_env_var("DB_POOL_PING_INTERVAL", "30")),
+        "recycle": float(get_env_var("DB_POOL_RECYCLE", "3600")),
+    },
+    # Debug aid, reports statements a request runs more than once with the
+    # same parameters under "repeated_in_request" of /api/status/statements.
+    "track_repeated_statements": get_env_var("DB_TRACK_REPEATED_STATEMENTS", "0") == "1",
+    # Worker threads running independent queries of one page concurrently.
+    "fan_out": {
+        "max_workers": int(get_env_var("DB_QUERY_WORKERS", "8")),
+        "deadline": float(get_env_var("DB_QUERY_DEADLINE", "15")),
+    },
 }
 
+# Online player list, read at most once per cache_ttl seconds and shared
+# by every request in between.
+ONLINE_PLAYERS_CONFIG = {
+    "cache_ttl": float(get_env_var("ONLINE_CACHE_TTL", "5")),
+}
+
+# Player ids by nickname, login id and member id, each cache keeping the
+# max_size most recently used. Nicknames can change, so they are kept for
+# nickname_ttl instead of ttl. Unknown keys are remembered for negative_ttl
+# seconds.
+ID_CACHE_CONFIG = {
+    "max_size": int(get_env_var("ID_CACHE_SIZE", "10000")),
+    "ttl": float(get_env_var("ID_CACHE_TTL", "3600")),
+    "nickname_ttl": float(get_env_var("ID_CACHE_NICKNAME_TTL", "300")),
+    "negative_ttl": float(get_env_var("ID_CACHE_NEGATIVE_TTL", "60")),
+}
+
+# The reference catalog and the player ranking snapshot are published as
+# files under directory whenever a process loads them from the database,
+# and other processes (e.g. several waitress processes) load those files
+# instead of querying while they are fresh. Only the ranking arrays are
+# shared memory, the rest is decoded into each process. Empty disables
+# the files.
+SNAPSHOT_CONFIG = {
+    "directory": get_env_var("SNAPSHOT_DIRECTORY", ""),
+}
+
+# /api/status/pool and /api/status/statements expose server internals to
+# anyone, so they answer 404 unless enabled for a debugging session.
+STATUS_ENDPOINTS_ENABLED = get_env_var("STATUS_ENDPOINTS_ENABLED", "0") == "1"
+
 # Email Configuration
 EMAIL_CONFIG = {
     "mail": get_env_var("EMAIL_ADDRESS"),
@@ -1,11 +1,53 @@
-from flask import Blueprint, request, abort, json, make_response, g
-
-from src.config import DATABASE_CONFIG
+from itertools import chain, islice
+
+from flask import (
+    Blueprint,
+    Response,
+    request,
+    abort,
+    json,
+    make_response,
+    g,
+    stream_with_context,
+)
+
+from src.config import DATABASE_CONFIG, STATUS_ENDPOINTS_ENABLED
+from src.controller.online import get_online_players
 from src.database import DatabaseConnection
-from src.database.player_ranking_manager import PlayerRankingOption
+from src.database.chart_ranking_manager import CHART_RECORD_PAGE_SIZE
+from src.database.chart_search_index import MAX_SUGGESTION_LIMIT, SUGGESTION_LIMIT
+from src.database.player_name_index import PLAYER_SEARCH_LIMIT
+from src.database.pool import pool_statistics
+from src.database.player_ranking_manager import PlayerRankingOption, RANKING_PAGE_SIZE
+from src.database.records import (
+    FETCH_CHUNK_SIZE,
+    ChartSearchEntry,
+    ScoreRecord,
+    encode_default,
+)
+from src.database.statements import statement_report
+from src.tools.conditional import conditional
+from src.tools.record_table import RecordTable
+from src.tools.search_parser import parse_search
 
 api = Blueprint("api", __name__, url_prefix="/api")
 
+NDJSON_MIMETYPE = "application/x-ndjson"
+ROWS_MIMETYPE = "application/vnd.oxygen.rows+json"
+COLUMNS_MIMETYPE = "application/vnd.oxygen.columns+json"
+
+# Record list formats, chosen with "?format=" or the Accept header.
+# json : array of objects (default)
+# ndjson : one object per line
+# rows : {"columns": [names], "rows": [[values], ...]}
+# columns : {name: [values], ...}
+RECORD_FORMATS = {
+    "json": "application/json",
+    "ndjson": NDJSON_MIMETYPE,
+    "rows": ROWS_MIMETYPE,
+    "columns": COLUMNS_MIMETYPE,
+}
+
 
 def get_db():
     if "db" not in g:
@@ -15,20 +57,47 @@ def get_db():
 
 
 @api.teardown_request
-def teardown_db(_):
+def teardown_db(exception):
+    db = g.pop("db", None)
+
+    if db is not None:
+        # A failed request may leave its connection in a broken state.
+        db.close(discard=exception is not None)
+
+
+def release_db():
     db = g.pop("db", None)
 
     if db is not None:
         db.close()
 
 
+# Version markers of the conditional endpoints, see src/tools/conditional.py
+def player_version(player_id):
+    return get_db().versions.get_player_version(player_id)
+
+
+def chart_version(chart_id):
+    return get_db().versions.get_chart_version(
+        chart_id, request.args.get("gauge_difficulty", 2, type=int)
+    )
+
+
+def history_version():
+    player_id = request.args.get("player_id", type=int)
+    chart_id = request.args.get("chart_id", type=int)
+
+    if player_id is None or chart_id is None:
+        return None
+
+    return player_version(player_id), chart_version(chart_id)
+
+
 @api.route("/online_players")
 @api.route("/userlist")
 @api.route("/player/online")
 def get_online():
-    response = make_response(
-        json.dumps(get_db().utils.get_online_players(), ensure_ascii=False)
-    )
+    response = make_response(get_online_players(get_db()).json)
 
     response.headers["Content-Type"] = "application/json"
 
@@ -67,10 +136,16 @@ def get_player_id(login_id):
 
 # Below four endpoint has argument as query string
 # gauge_difficulty : If you set this argument, result only shows selected gauge difficulty
+# page, cursor : Scoreboards are paged when either one is set. The token for
+#                the next page is sent back in the X-Next-Cursor header.
+#                The unpaged player scoreboard is streamed, see make_stream_response.
 @api.route("/scoreboard/player/<int:player_id>", methods=["GET"])
+@conditional(player_version)
 def get_scoreboard_by_player(player_id):
     gauge_difficulty = request.args.get("gauge_difficulty", type=int)
     show_f_rank = request.args.get("show-f-rank", type=bool)
+    page = request.args.get("page", type=int)
+    cursor = request.args.get("cursor")
 
     if gauge_difficulty is None:
         gauge_difficulty = 2
@@ -78,51 +153,89 @@ def get_scoreboard_by_player(player_id):
     if show_f_rank is None:
         show_f_rank = True
 
-    player_scoreboard = get_db().player_ranking.get_player_top_records(
-        player_id, gauge_difficulty, show_f_rank, None
-    )
+    if page is None and cursor is None:
+        return make_stream_response(
+            ScoreRecord,
+            lambda db: db.player_ranking.iter_player_top_records(
+                player_id, gauge_difficulty, show_f_rank
+            ),
+            abort_if_empty=True,
+        )
+
+    try:
+        player_scoreboard = get_db().player_ranking.get_player_top_records(
+            player_id, gauge_difficulty, show_f_rank, page, after=cursor, as_table=True
+        )
+    except ValueError:
+        abort(400)
 
     if player_scoreboard is None:
         abort(404)
 
-    return make_json_response(player_scoreboard)
+    return make_table_response(player_scoreboard)
 
 
 @api.route("/scoreboard/player/<int:player_id>/recent", methods=["GET"])
+@conditional(player_version)
 def get_recent_records_by_player(player_id):
     gauge_difficulty = request.args.get("gauge_difficulty", type=int)
+    show_f_rank = request.args.get("show-f-rank", type=bool)
+    cursor = request.args.get("cursor")
 
     if gauge_difficulty is None:
         gauge_difficulty = 2
 
-    recent_records = get_db().player_ranking.get_recent_records(
-        player_id, gauge_difficulty
-    )
+    if show_f_rank is None:
+        show_f_rank = True
+
+    try:
+        recent_records = get_db().player_ranking.get_recent_records(
+            player_id, gauge_difficulty, show_f_rank, after=cursor, as_table=True
+        )
+    except ValueError:
+        abort(400)
 
     if recent_records is None:
         abort(404)
 
-    return make_json_response(recent_records)
+    return make_table_response(recent_records)
 
 
+# offset, limit : Page of the chart scoreboard, limit is capped at 1000
+# around : Player code whose record the page should be centered on
 @api.route("/scoreboard/chart/<int:chart_id>", methods=["GET"])
+@conditional(chart_version)
 def get_scoreboard_by_chart(chart_id):
     gauge_difficulty = request.args.get("gauge_difficulty", type=int)
+    offset = request.args.get("offset", 0, type=int)
+    limit = request.args.get("limit", CHART_RECORD_PAGE_SIZE, type=int)
+    cursor = request.args.get("cursor")
+    around = request.args.get("around", type=int)
 
     if gauge_difficulty is None:
         gauge_difficulty = 2
 
-    chart_scoreboard = get_db().chart_ranking.get_chart_top_records(
-        chart_id, gauge_difficulty
-    )
+    try:
+        chart_scoreboard = get_db().chart_ranking.get_chart_top_records(
+            chart_id,
+            gauge_difficulty,
+            limit=min(max(limit, 1), 1000),
+            offset=max(offset, 0),
+            after=cursor,
+            around=around,
+            as_table=True,
+        )
+    except ValueError:
+        abort(400)
 
     if chart_scoreboard is None:
         abort(404)
 
-    return make_json_response(chart_scoreboard)
+    return make_table_response(chart_scoreboard)
 
 
 @api.route("/scoreboard/history", methods=["GET"])
+@conditional(history_version)
 def get_record_histories():
     player_id = request.args.get("player_id", type=int)
     chart_id = request.args.get("chart_id", type=int)
@@ -135,13 +248,14 @@ def get_record_histories():
         gauge_difficulty = 2
 
     histories = get_db().player_ranking.get_record_histories(
-        player_id, chart_id, gauge_difficulty
+        player_id, chart_id, gauge_difficulty, False, as_table=True
     )
 
-    return make_json_response(histories)
+    return make_table_response(histories)
 
 
 @api.route("/chart/<int:chart_id>", methods=["GET"])
+@conditional(chart_version)
 def get_chart(chart_id):
     gauge_difficulty = request.args.get("gauge_difficulty", type=int)
 
@@ -156,21 +270,36 @@ def get_chart(chart_id):
     return make_json_response(music_info)
 
 
+def get_player_fields():
+    # "?fields=nickname,level" returns only those keys of the profile and
+    # skips the queries the others need.
+    fields = request.args.get("fields")
+
+    if not fields:
+        return None
+
+    return tuple(field.strip() for field in fields.split(","))
+
+
 @api.route("/player/<int:player_id>", methods=["GET"])
+@conditional(player_version)
 def get_player(player_id):
     gauge_difficulty = request.args.get("gauge_difficulty", type=int)
 
     if gauge_difficulty is None:
         gauge_difficulty = 2
 
-    player_info = get_db().info.get_player_info(player_id, gauge_difficulty)
+    try:
+        player_info = get_db().info.get_player_info(
+            player_id, gauge_difficulty, fields=get_player_fields()
+        )
+    except ValueError:
+        abort(400)
 
     if player_info is None:
         abort(404)
 
-    return make_json_response(
-        get_db().info.get_player_info(player_id, gauge_difficulty)
-    )
+    return make_json_response(player_info)
 
 
 @api.route("/player/<nickname>", methods=["GET"])
@@ -181,17 +310,21 @@ def get_player_by_nickname(nickname):
         gauge_difficulty = 2
 
     player_id = get_db().utils.nickname_to_usercode(nickname)
-    player_info = get_db().info.get_player_info(player_id, gauge_difficulty)
+    try:
+        player_info = get_db().info.get_player_info(
+            player_id, gauge_difficulty, fields=get_player_fields()
+        )
+    except ValueError:
+        abort(400)
 
     if player_info is None:
         abort(404)
 
-    return make_json_response(
-        get_db().info.get_player_info(player_id, gauge_difficulty)
-    )
+    return make_json_response(player_info)
 
 
 @api.route("/chart/ranking")
+@conditional(lambda: get_db().versions.get_play_count_version())
 def get_chart_ranking():
     top = request.args.get("top", type=int)
 
@@ -201,10 +334,31 @@ def get_chart_ranking():
     return make_json_response(get_db().chart_ranking.get_play_count_ranking(top=top))
 
 
+# category : PlayerRankingOption value, clear ranking by default
+# offset, limit : Page of the ranking, limit is capped at 1000
+# around : Player code to center the page on
 @api.route("/players")
+@conditional(lambda: get_db().versions.get_player_ranking_version(), max_age=60)
 def get_all_player():
+    category = request.args.get(
+        "category", PlayerRankingOption.ORDER_CLEAR.value, type=int
+    )
+    offset = request.args.get("offset", 0, type=int)
+    limit = request.args.get("limit", RANKING_PAGE_SIZE, type=int)
+    around = request.args.get("around", type=int)
+
+    try:
+        category = PlayerRankingOption(category)
+    except ValueError:
+        abort(404)
+
     return make_json_response(
-        get_db().player_ranking.get_player_ranking(PlayerRankingOption.ORDER_CLEAR)
+        get_db().player_ranking.get_player_ranking(
+            category,
+            offset=max(offset, 0),
+            limit=min(max(limit, 1), 1000),
+            around=around,
+        )
     )
 
 
@@ -215,7 +369,37 @@ def get_all_charts():
         "options": {"level": [0, 180], "title": True, "artist": True, "mapper": True},
     }
 
-    return make_json_response(get_db().utils.search_chart(empty_search_request))
+    return make_stream_response(
+        ChartSearchEntry,
+        lambda db: db.utils.iter_search_chart(empty_search_request),
+    )
+
+
+@api.route("/charts/suggest")
+@conditional(lambda: get_db().versions.get_chart_search_version(), max_age=60)
+def suggest_charts():
+    # q takes the same syntax as the chart search, e.g. "--level 10 50 lov"
+    search_data = parse_search(request.args.get("q", ""))
+    limit = request.args.get("limit", SUGGESTION_LIMIT, type=int)
+
+    if search_data is None:
+        abort(400)
+
+    return make_json_response(
+        get_db().utils.suggest_chart(
+            search_data, min(max(limit, 1), MAX_SUGGESTION_LIMIT)
+        )
+    )
+
+
+@api.route("/players/search")
+def search_players():
+    keyword = request.args.get("q", "")
+    limit = request.args.get("limit", PLAYER_SEARCH_LIMIT, type=int)
+
+    return make_json_response(
+        get_db().utils.find_player(keyword, min(max(limit, 1), PLAYER_SEARCH_LIMIT))
+    )
 
 
 @api.route("/command/status")
@@ -223,8 +407,169 @@ def get_command_status():
     abort(404)
 
 
+@api.route("/status/pool")
+def get_pool_status():
+    if not STATUS_ENDPOINTS_ENABLED:
+        abort(404)
+
+    return make_json_response(pool_statistics())
+
+
+@api.route("/status/statements")
+def get_statement_status():
+    if not STATUS_ENDPOINTS_ENABLED:
+        abort(404)
+
+    return make_json_response(statement_report())
+
+
 def make_json_response(data):
-    response = make_response(json.dumps(data, ensure_ascii=False, default=str))
+    response = make_response(encode_json(data))
     response.headers["Content-Type"] = "application/json"
 
     return response
+
+
+def requested_record_format():
+    record_format = request.args.get("format")
+
+    if record_format in RECORD_FORMATS:
+        return record_format
+
+    best_match = request.accept_mimetypes.best_match(list(RECORD_FORMATS.values()))
+
+    for record_format, mimetype in RECORD_FORMATS.items():
+        if mimetype == best_match:
+            return record_format
+
+    return "json"
+
+
+def make_table_response(table):
+    record_format = requested_record_format()
+
+    match record_format:
+        case "rows":
+            body = encode_json(table.to_row_arrays())
+        case "columns":
+            body = encode_json(table.to_column_arrays())
+        case "ndjson":
+            body = "".join(encode_json(record) + "\n" for record in table.records)
+        case _:
+            body = encode_json(table.to_records())
+
+    response = make_response(body)
+    response.headers["Content-Type"] = RECORD_FORMATS[record_format]
+
+    if table.next_cursor is not None:
+        response.headers["X-Next-Cursor"] = table.next_cursor
+
+    return response
+
+
+# Streams records in the requested record format. The columns format needs
+# every row before it can start, so it is sent as one body instead.
+# record_class : record type of the streamed records
+# open_records : callable taking a DatabaseConnection and returning an
+#                iterator of records, read from the database in chunks.
+# abort_if_empty : Respond 404 instead of an empty list.
+def make_stream_response(record_class, open_records, abort_if_empty=False):
+    # The stream owns its connection so it can discard it when the body is
+    # abandoned half way. The request's own connection, used by the version
+    # check of @conditional, goes back to the pool first so a stream holds
+    # one connection rather than two until the body is sent.
+    release_db()
+    database = DatabaseConnection(DATABASE_CONFIG)
+    source = open_records(database)
+
+    try:
+        # Runs the query now so an empty result or a failure still gets
+        # a proper status code.
+        first_record = next(source, None)
+    except Exception:
+        source.close()
+        database.close(discard=True)
+        raise
+
+    if first_record is None:
+        source.close()
+        database.close()
+
+        if abort_if_empty:
+            abort(404)
+
+        records = iter(())
+    else:
+        records = chain((first_record,), source)
+
+    record_format = requested_record_format()
+
+    if record_format == "columns":
+        try:
+            table = RecordTable(record_class, records)
+        finally:
+            if first_record is not None:
+                source.close()
+                database.close()
+
+        return make_table_response(table)
+
+    def generate():
+        # Only a body sent to the end hands the connection back. A failure
+        # truncates the body after the headers went out, and a client that
+        # disconnects closes the generator with GeneratorExit, which no
+        # except Exception sees; both leave the cursor mid-result.
+        completed = False
+
+        try:
+            if record_format == "ndjson":
+                for chunk in iter_chunks(records):
+                    yield "".join(encode_json(record) + "\n" for record in chunk)
+
+                completed = True
+                return
+
+            if record_format == "rows":
+                start = (
+                    '{"columns":' + encode_json(list(record_class.FIELDS)) + ',"rows":['
+                )
+                end = "]}"
+
+                def encode_record(record):
+                    return encode_json(record.to_row())
+            else:
+                start = "["
+                end = "]"
+                encode_record = encode_json
+
+            yield start
+
+            for index, chunk in enumerate(iter_chunks(records)):
+                yield ("," if index else "") + ",".join(
+                    encode_record(record) for record in chunk
+                )
+
+            yield end
+            completed = True
+        finally:
+            if first_record is not None:
+                source.close()
+                database.close(discard=not completed)
+
+    return Response(
+        stream_with_context(generate()), mimetype=RECORD_FORMATS[record_format]
+    )
+
+
+def iter_chunks(records):
+    while True:
+        chunk = list(islice(records, FETCH_CHUNK_SIZE))
+
+        if not chunk:
+            return
+
+        yield chunk
+
+
+def encode_json(data):
+    return json.dumps(data, ensure_ascii=False, default=encode_default)
@@ -0,0 +1,39 @@
+import threading
+
+from flask import json, render_template
+
+from src.config import ONLINE_PLAYERS_CONFIG
+from src.tools.ttl_cache import TtlCache
+
+_cache = TtlCache(ONLINE_PLAYERS_CONFIG["cache_ttl"])
+
+
+class OnlinePlayers:
+    """One read of the online players, serialized once for every request sharing it."""
+
+    def __init__(self, players):
+        self.players = players
+        self.json = json.dumps(players, ensure_ascii=False).encode("utf-8")
+
+        self._pages = {}
+        self._pages_lock = threading.Lock()
+
+    def render(self, template_name):
+        page = self._pages.get(template_name)
+
+        if page is None:
+            with self._pages_lock:
+                page = self._pages.get(template_name)
+
+                if page is None:
+                    page = render_template(template_name, online=self.players)
+                    self._pages[template_name] = page
+
+        return page
+
+
+def get_online_players(db):
+    # db : DatabaseConnection of the request, only used when the cache expired
+    return _cache.get(
+        "online_players", lambda: OnlinePlayers(db.utils.get_online_players())
+    )
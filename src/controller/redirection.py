@@ -4,7 +4,6 @@ from src.config import DATABASE_CONFIG
 from src.database import DatabaseConnection
 
 redirection = Blueprint("redirection", __name__)
-database = DatabaseConnection(DATABASE_CONFIG)
 
 
 def get_db():
@@ -15,11 +14,12 @@ def get_db():
 
 
 @redirection.teardown_request
-def teardown_db(_):
+def teardown_db(exception):
     db = g.pop("db", None)
 
     if db is not None:
-        db.close()
+        # A failed request may leave its connection in a broken state.
+        db.close(discard=exception is not None)
 
 
 @redirection.route("/p/<nickname>")
@@ -1,8 +1,13 @@
 from flask import Blueprint, request, render_template, abort, redirect, g, jsonify
 
 from src.config import DATABASE_CONFIG
+from src.controller.online import get_online_players
 from src.database import DatabaseConnection
-from src.database.player_ranking_manager import PlayerRankingOption
+from src.database.chart_ranking_manager import CHART_RECORD_PAGE_SIZE
+from src.database.executor import get_query_executor
+from src.database.player_name_index import PLAYER_SEARCH_LIMIT
+from src.database.player_ranking_manager import PlayerRankingOption, RANKING_PAGE_SIZE
+from src.tools.conditional import conditional
 from src.tools.search_parser import parse_search
 
 scoreboard = Blueprint("scoreboard", __name__)
@@ -16,18 +21,50 @@ def get_db():
 
 
 @scoreboard.teardown_request
-def teardown_db(_):
+def teardown_db(exception):
+    db = g.pop("db", None)
+
+    if db is not None:
+        # A failed request may leave its connection in a broken state.
+        db.close(discard=exception is not None)
+
+
+def release_db():
+    # Hands the request's connection back before a fan-out borrows its own,
+    # so a page holds one connection per running query instead of one more
+    # for the version check that came before them.
     db = g.pop("db", None)
 
     if db is not None:
         db.close()
 
 
+# Version markers of the conditional pages, see src/tools/conditional.py
+def player_version(player_code, difficulty=None):
+    return get_db().versions.get_player_version(player_code)
+
+
+def chart_version(music_code, difficulty=2):
+    return get_db().versions.get_chart_version(music_code, difficulty)
+
+
+def history_version():
+    player_id = request.args.get("player_id", type=int)
+    chart_id = request.args.get("chart_id", type=int)
+
+    if player_id is None or chart_id is None:
+        return None
+
+    return (
+        player_version(player_id),
+        chart_version(chart_id, request.args.get("gauge_difficulty", 2, type=int)),
+    )
+
+
 @scoreboard.route("/online")
 @scoreboard.route("/online-for-launcher")
 def online():
-    online_players = get_db().utils.get_online_players()
-    return render_template("online.html", online=online_players)
+    return get_online_players(get_db()).render("online.html")
 
 
 @scoreboard.route("/music", methods=["GET"])
@@ -41,82 +78,149 @@ def music_find():
     return render_template("find-chart.html", song_list=result_data, init=False)
 
 
+@scoreboard.route("/find-player", methods=["GET"])
+def player_find():
+    keyword = request.args.get("keyword")
+
+    if keyword is None:
+        return render_template("find-player.html", players=[], init=True)
+
+    players = get_db().utils.find_player(keyword, PLAYER_SEARCH_LIMIT)
+    return render_template(
+        "find-player.html", players=players, keyword=keyword, init=False
+    )
+
+
 @scoreboard.route("/player-scoreboard/<player_code>")
 def append_difficulty(player_code):
     return redirect(f"/player-scoreboard/{player_code}/2", code=301)
 
 
 @scoreboard.route("/player-scoreboard/<player_code>/<difficulty>")
+@conditional(player_version)
 def player_scoreboard(player_code, difficulty):
     show_f_rank = True if request.args.get("show-f-rank", type=int) == 1 else False
     show_recent = True if request.args.get("show-recent", type=int) == 1 else False
     page = request.args.get("page", type=int)
+    cursor = request.args.get("cursor")
 
     if page is None:
         page = 0
 
     if show_recent:
-        player_scores = get_db().player_ranking.get_recent_records(
-            player_code, difficulty, show_f_rank
-        )
+        def get_player_scores(db):
+            return db.player_ranking.get_recent_records(
+                player_code, difficulty, show_f_rank, after=cursor
+            )
     else:
-        player_scores = get_db().player_ranking.get_player_top_records(
-            player_code, difficulty, show_f_rank, page=page
-        )
+        def get_player_scores(db):
+            return db.player_ranking.get_player_top_records(
+                player_code, difficulty, show_f_rank, page=page, after=cursor
+            )
 
-    player_metadata = get_db().info.get_player_info(player_code, difficulty)
-    player_tiers = get_db().info.get_tier_info(player_code)
-    player_score_count = get_db().player_ranking.get_player_top_records_count(
-        player_code, difficulty, show_f_rank
-    )
+    release_db()
 
-    if player_metadata is None:
+    try:
+        results = get_query_executor(DATABASE_CONFIG).run(
+            {
+                "scores": get_player_scores,
+                "metadata": lambda db: db.info.get_player_info(
+                    player_code, difficulty
+                ),
+                "tiers": lambda db: db.info.get_tier_info(player_code),
+                "score_count": lambda db: db.player_ranking.get_player_top_records_count(
+                    player_code, difficulty, show_f_rank
+                ),
+            }
+        )
+    except ValueError:
+        return abort(400)
+
+    if results["metadata"] is None:
         return abort(404)
 
     return render_template(
         "player.html",
-        scoreboard=player_scores,
-        metadata=player_metadata,
-        tier=player_tiers,
+        scoreboard=results["scores"],
+        metadata=results["metadata"],
+        tier=results["tiers"],
         show_f_rank=show_f_rank,
         show_recent=show_recent,
         page=page,
-        max_page=int(player_score_count / 100),
+        max_page=int(results["score_count"] / 100),
+        next_cursor=getattr(results["scores"], "next_cursor", None),
     )
 
 
 @scoreboard.route("/music-scoreboard/<music_code>")
 @scoreboard.route("/music-scoreboard/<music_code>/<difficulty>")
+@conditional(chart_version)
 def music_scoreboard(music_code, difficulty=2):
     if music_code is None:
         return abort(404)
 
-    music_scores = get_db().chart_ranking.get_chart_top_records(music_code, difficulty)
-    music_metadata = get_db().info.get_music_info(music_code, difficulty)
+    cursor = request.args.get("cursor")
+    around = request.args.get("player", type=int)
+
+    release_db()
+
+    try:
+        results = get_query_executor(DATABASE_CONFIG).run(
+            {
+                "scores": lambda db: db.chart_ranking.get_chart_top_records(
+                    music_code,
+                    difficulty,
+                    limit=CHART_RECORD_PAGE_SIZE,
+                    after=cursor,
+                    around=around,
+                ),
+                "metadata": lambda db: db.info.get_music_info(music_code, difficulty),
+            }
+        )
+    except ValueError:
+        return abort(400)
+
     url_before = request.headers.get("referer")
 
-    if music_metadata is None:
+    if results["metadata"] is None:
         return abort(404)
 
     return render_template(
         "chart.html",
-        scoreboard=music_scores,
-        metadata=music_metadata,
+        scoreboard=results["scores"],
+        metadata=results["metadata"],
         referer=url_before,
+        is_first_page=cursor is None and around is None,
+        next_cursor=getattr(results["scores"], "next_cursor", None),
     )
 
 
 @scoreboard.route("/ranking/player")
 @scoreboard.route("/ranking/player/<int:ranking_category>")
+@conditional(
+    lambda ranking_category=7: get_db().versions.get_player_ranking_version(),
+    max_age=60,
+)
 def player_ranking(ranking_category=7):
+    page = request.args.get("page", type=int)
+
+    if page is None or page < 0:
+        page = 0
+
     try:
         if 0 <= ranking_category <= 8:
-            info = get_db().player_ranking.get_player_ranking(ranking_category)
+            info = get_db().player_ranking.get_player_ranking(
+                ranking_category,
+                offset=page * RANKING_PAGE_SIZE,
+                limit=RANKING_PAGE_SIZE,
+            )
             return render_template(
                 "player-ranking.html",
                 status=info["player_infos"],
                 category_name=info["current_option_name"],
                 category_code=ranking_category,
+                page=page,
+                max_page=max(info["total_count"] - 1, 0) // RANKING_PAGE_SIZE,
             )
 
         return abort(404)
@@ -125,6 +229,7 @@ def player_ranking(ranking_category=7):
 
 
 @scoreboard.route("/ranking/chart")
+@conditional(lambda: get_db().versions.get_play_count_version())
 def chart_ranking():
     top = request.args.get("top")
     date_start = request.args.get("date_start")
@@ -147,6 +252,7 @@ def chart_ranking():
 
 
 @scoreboard.route("/history", methods=["GET"])
+@conditional(history_version)
 def history():
     player_id = request.args.get("player_id", type=int)
     member_id = request.args.get("member_id", type=int)
@@ -168,18 +274,28 @@ def history():
     if gauge_difficulty is None:
         gauge_difficulty = 2
 
-    histories = get_db().player_ranking.get_record_histories(
-        player_id, chart_id, gauge_difficulty, order_by_date=order_by_date
+    release_db()
+
+    results = get_query_executor(DATABASE_CONFIG).run(
+        {
+            "histories": lambda db: db.player_ranking.get_record_histories(
+                player_id, chart_id, gauge_difficulty, order_by_date=order_by_date
+            ),
+            "chart_data": lambda db: db.info.get_music_info(
+                chart_id, gauge_difficulty
+            ),
+            # The page only shows who the records belong to.
+            "player_data": lambda db: db.info.get_player_info(
+                player_id, gauge_difficulty, fields=("nickname", "level")
+            ),
+        }
     )
 
-    chart_data = get_db().info.get_music_info(chart_id, gauge_difficulty)
-    player_data = get_db().info.get_player_info(player_id, gauge_difficulty)
-
     return render_template(
         "player-history.html",
-        histories=histories,
-        player_info=player_data,
-        chart_info=chart_data,
+        histories=results["histories"],
+        player_info=results["player_data"],
+        chart_info=results["chart_data"],
         player_id=player_id,
         gauge_difficulty=gauge_difficulty,
         order_by_date=order_by_date,
@@ -187,6 +303,7 @@ def history():
 
 
 @scoreboard.route("/ranking/best_play/<int:player_id>")
+@conditional(lambda player_id: player_version(player_id))
 def best_play_ranking(player_id):
     sort_option = request.args.get("sort_option", type=int)
 
@@ -20,11 +20,12 @@ def get_db():
 
 
 @troubleshoot.teardown_request
-def teardown_db(_):
+def teardown_db(exception):
     db = g.pop("db", None)
 
     if db is not None:
-        db.close()
+        # A failed request may leave its connection in a broken state.
+        db.close(discard=exception is not None)
 
 
 @troubleshoot.route("/fix-login", methods=["POST", "GET"])
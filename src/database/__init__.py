@@ -1,31 +1,40 @@
-import pyodbc
-
 from src.database.chart_ranking_manager import ChartRankingManager
 from src.database.info_manager import InfoManager
 from src.database.player_ranking_manager import PlayerRankingManager
+from src.database.pool import ConnectionLease, get_pool
 from src.database.utils import DatabaseUtils
+from src.database.version_manager import VersionManager
 from src.database.account import AccountManager
 
 
 class DatabaseConnection:
     def __init__(self, database_config):
-        self._connection = pyodbc.connect(database_config["connection_string"])
-        self._trade_connection = pyodbc.connect(
-            database_config["trade_connection_string"]
+        pool_options = database_config.get("pool", {})
+        track_repetitions = database_config.get("track_repeated_statements", False)
+
+        # Connections are borrowed lazily, so read-only pages never touch the
+        # trade database and requests without queries never touch either.
+        self._connection = ConnectionLease(
+            get_pool("main", database_config["connection_string"], pool_options),
+            track_repetitions,
+        )
+        self._trade_connection = ConnectionLease(
+            get_pool(
+                "trade", database_config["trade_connection_string"], pool_options
+            ),
+            track_repetitions,
         )
 
         self.player_ranking = PlayerRankingManager(self._connection)
         self.chart_ranking = ChartRankingManager(self._connection)
         self.info = InfoManager(self._connection)
+        self.versions = VersionManager(self._connection)
         self.utils = DatabaseUtils(self._connection, self._trade_connection)
         self.account_manager = AccountManager(self._connection, self._trade_connection)
 
-    def close(self):
-        try:
-            self._connection.close()
-            self._trade_connection.close()
-        except pyodbc.ProgrammingError:
-            return
+    def close(self, discard=False):
+        self._connection.release(discard)
+        self._trade_connection.release(discard)
 
     def __del__(self):
         self.close()
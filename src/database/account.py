@@ -1,5 +1,9 @@
 from pyodbc import DataError
 
+from src.database.id_cache import login_ids, nickname_ids, nickname_key
+from src.database.memo import memoized
+from src.database.player_name_index import player_name_index
+from src.database.reference_catalog import reference_catalog
 from src.tools.encrypt import make_email_auth_token
 from src.tools.input_validator import InputValidator
 
@@ -10,25 +14,14 @@ class AccountManager:
         self._connection_trade = connection_trade
 
     def get_change_nickname_token(self, username, password):
-        with self._connection.cursor() as cursor:
-            cursor.execute(
-                "SELECT id FROM dbo.member WHERE userid=? AND passwd=?",
-                (username, password),
-            )
-            account_id = cursor.fetchval()
+        member = self._find_member(username, password)
 
-            if account_id is None:
-                return None
-
-            cursor.execute(
-                "SELECT USER_INDEX_ID FROM dbo.T_o2jam_charinfo WHERE USER_ID=?",
-                username,
-            )
-            player_id = cursor.fetchval()
+        if member is None or member[1] is None:
+            return None
 
-            if player_id is None:
-                return None
+        account_id, player_id = member
 
+        with self._connection.cursor() as cursor:
             auth_token = make_email_auth_token()
 
             cursor.execute(
@@ -46,26 +39,14 @@ class AccountManager:
             return auth_token
 
     def get_nickname_changeable(self, username, password):
-        with self._connection.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT
-                    c.USER_INDEX_ID
-                FROM
-                    dbo.member AS m
-                LEFT OUTER JOIN
-                    dbo.T_o2jam_charinfo AS c ON m.userid = c.USER_ID
-                WHERE
-                    m.userid = ? AND m.passwd = ?
-                """,
-                (username, password),
-            )
+        member = self._find_member(username, password)
 
-            player_index_id = cursor.fetchval()
+        if member is None or member[1] is None:
+            return False
 
-            if player_index_id is None:
-                return False
+        player_index_id = member[1]
 
+        with self._connection.cursor() as cursor:
             cursor.execute(
                 """
                 SELECT
@@ -81,24 +62,13 @@ class AccountManager:
             player_gem = cursor.fetchval()
 
             cursor.execute(
-                """
-                SELECT exchange_money
-                FROM
-                    dbo.nickname_exchange_info
-                WHERE
-                    nickname_count = COALESCE((
-                        SELECT
-                            COUNT(nickname)
-                        FROM
-                            dbo.nickname_history
-                        WHERE
-                            player_id = ?
-                    ), 1)
-                """,
+                "SELECT COUNT(nickname) FROM dbo.nickname_history WHERE player_id = ?",
                 player_index_id,
             )
 
-            nickname_exchange_money = cursor.fetchval()
+            nickname_count = cursor.fetchval()
+            reference_catalog.ensure_fresh(self._connection)
+            nickname_exchange_money = reference_catalog.exchange_money(nickname_count)
 
             return (
                 player_gem is not None
@@ -162,13 +132,11 @@ class AccountManager:
             elif player_nickname_count > 9:
                 player_nickname_count = 9
 
-            cursor.execute(
-                "SELECT exchange_money FROM dbo.nickname_exchange_info WHERE nickname_count = ?",
-                player_nickname_count,
+            reference_catalog.ensure_fresh(self._connection)
+            nickname_exchange_money = reference_catalog.exchange_money(
+                player_nickname_count
             )
 
-            nickname_exchange_money = cursor.fetchval()
-
             cursor.execute(
                 "SELECT GEM FROM dbo.T_o2jam_charCash WHERE USER_INDEX_ID = ?",
                 player_index_id,
@@ -204,10 +172,21 @@ class AccountManager:
             )
 
             self._connection.commit()
+            # Anything read before the rename is stale now.
+            self._connection.memo.clear()
+
+            player_name_index.rename(player_index_id, nickname)
+            nickname_ids.invalidate(nickname_key(nickname))
+
+            if current_nickname is not None:
+                nickname_ids.invalidate(nickname_key(current_nickname))
 
             return True, "Nickname changed successfully!"
 
     def get_player_id(self, username):
+        return login_ids.get(username, lambda: self._load_player_id(username))
+
+    def _load_player_id(self, username):
         with self._connection.cursor() as cursor:
             cursor.execute(
                 "SELECT USER_INDEX_ID FROM dbo.T_o2jam_charinfo WHERE USER_ID = ?",
@@ -215,3 +194,27 @@ class AccountManager:
             )
 
             return cursor.fetchval()
+
+    @memoized
+    def _find_member(self, username, password):
+        # (member id, player id or None) of the account, None when the login
+        # is wrong. Shared by the nickname change checks of one request.
+        with self._connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT
+                    m.id,
+                    c.USER_INDEX_ID
+                FROM
+                    dbo.member AS m
+                LEFT OUTER JOIN
+                    dbo.T_o2jam_charinfo AS c ON m.userid = c.USER_ID
+                WHERE
+                    m.userid = ? AND m.passwd = ?
+                """,
+                (username, password),
+            )
+
+            member = cursor.fetchone()
+
+            return tuple(member) if member is not None else None
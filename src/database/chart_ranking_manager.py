@@ -1,82 +1,127 @@
 import datetime
 
+from src.database.records import ChartRecord, RowMapper, row_number
+from src.database.reference_catalog import catalog_progress_name, reference_catalog
+from src.database.statements import (
+    CHART_RECORD_ORDER,
+    CHART_RECORD_POSITION,
+    CHART_TOP_RECORDS,
+    PLAY_COUNT_RANKING,
+)
+from src.tools.pagination import decode_cursor, encode_cursor, seek_condition
+from src.tools.record_table import RecordTable
+
+CHART_RECORD_PAGE_SIZE = 50
+
+CHART_RECORD_MAPPER = RowMapper(
+    ChartRecord,
+    player_code=0,
+    player_nickname=1,
+    score_cool=2,
+    score_good=3,
+    score_bad=4,
+    score_miss=5,
+    score_max_combo=6,
+    score=7,
+    is_cleared_record=8,
+    cleared_time=9,
+    progress=catalog_progress_name(10),
+    pattern_order=11,
+    play_speed_rate=12,
+    play_timing_rate=13,
+    fln_option=14,
+    sln_option=15,
+    is_nln=16,
+    row_number=row_number(17),
+)
+
 
 class ChartRankingManager:
     def __init__(self, connection):
         self._connection = connection
 
-    def get_chart_top_records(self, music_id, gauge_difficulty):
-        with self._connection.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT 
-                    h.PlayerCode, 
-                    c.USER_NICKNAME, 
-                    h.Cool, 
-                    h.Good, 
-                    h.Bad, 
-                    h.Miss, 
-                    h.MaxCombo, 
-                    h.Score,
-                    h.isClear,
-                    FORMAT(h.PlayedTime, 'yyyy-MM-dd hh:mm tt', 'en-US') AS PlayedTime,
-                    p.progress_name,
-                    h.PatternOrder,
-                    ROUND(h.PlaySpeedRate, 3) AS PlaySpeedRate,
-                    h.PlayTimingRate,
-                    h.FLNOption,
-                    h.SLNOption,
-                    h.isNLN,
-                    ROW_NUMBER() OVER (ORDER BY
-                        h.Score DESC,
-                        h.isClear DESC,
-                        h.Cool DESC,
-                        s.Clear,
-                        h.PlayedTime DESC,
-                        h.PlayerCode DESC) status
-                FROM 
-                    dbo.O2JamHighscore h 
-                    LEFT OUTER JOIN dbo.T_o2jam_charinfo c on h.PlayerCode = c.USER_INDEX_ID
-                    LEFT OUTER JOIN dbo.ProgressInfo p ON p.progress_index = h.Progress
-                    LEFT OUTER JOIN dbo.O2JamStatus s ON h.PlayerCode = s.PlayerCode
-                WHERE 
-                    h.MusicCode = ?
-                    AND h.Difficulty = ?
-            """,
-                (music_id, gauge_difficulty),
+    def get_chart_top_records(
+        self,
+        music_id,
+        gauge_difficulty,
+        limit=None,
+        offset=0,
+        after=None,
+        around=None,
+        as_table=False,
+    ):
+        # limit : page size, the whole board is returned when omitted
+        # after : continuation token of a previous page, seeks past its last row
+        # around : player code whose record the page should be centered on
+        # as_table : return the records as a RecordTable
+        params = [music_id, gauge_difficulty]
+        seek = "none"
+        row_offset = 0
+
+        if after is not None:
+            *last_values, row_offset = decode_cursor(
+                after, len(CHART_RECORD_ORDER) + 1
+            )
+            _, seek_params = seek_condition(CHART_RECORD_ORDER, last_values)
+            seek = "after"
+            params.extend(seek_params)
+        elif around is not None and limit is not None:
+            # The player's own row rather than their RANK(), which a tie
+            # shares with rows that may be far above it.
+            position = self._get_player_chart_position(
+                music_id, gauge_difficulty, around
             )
+            offset = max(position - 1 - limit // 2, 0)
 
+        if limit is None:
+            page_variant = "all"
+        elif after is not None:
+            page_variant = "next"
+            params.append(limit)
+        else:
+            # Top-N of a chart is a bounded sort rather than a full board.
+            page_variant = "offset"
+            params.extend([offset, limit])
+            row_offset = offset
+
+        with self._connection.execute(
+            CHART_TOP_RECORDS.sql(seek=seek, page=page_variant), params
+        ) as cursor:
             raw_result = cursor.fetchall()
-            records = []
 
-            for record in raw_result:
-                records.append(
-                    {
-                        "player_code": record[0],
-                        "player_nickname": record[1],
-                        "score_cool": record[2],
-                        "score_good": record[3],
-                        "score_bad": record[4],
-                        "score_miss": record[5],
-                        "score_max_combo": record[6],
-                        "score": record[7],
-                        "is_cleared_record": record[8],
-                        "cleared_time": record[9],
-                        "progress": record[10],
-                        "pattern_order": record[11],
-                        "play_speed_rate": record[12],
-                        "play_timing_rate": record[13],
-                        "fln_option": record[14],
-                        "sln_option": record[15],
-                        "is_nln": record[16],
-                        "row_number": record[17],
-                    }
+        if len(raw_result) == 0:
+            return None
+
+        reference_catalog.ensure_fresh(self._connection)
+        records = CHART_RECORD_MAPPER.map_rows(raw_result, row_offset=row_offset)
+        next_cursor = None
+
+        if limit is not None and len(raw_result) == limit:
+            last = raw_result[-1]
+            next_cursor = encode_cursor(
+                (
+                    last[7],
+                    last[8],
+                    last[2],
+                    last[18],
+                    last[9],
+                    last[0],
+                    last[17] + row_offset,
                 )
+            )
 
-            if len(records) == 0:
-                return None
+        table = RecordTable(ChartRecord, records, next_cursor)
+
+        return table if as_table else table.to_records()
 
-            return records
+    def _get_player_chart_position(self, music_id, gauge_difficulty, player_id):
+        with self._connection.execute(
+            CHART_RECORD_POSITION.sql(), (music_id, gauge_difficulty, player_id)
+        ) as cursor:
+            position = cursor.fetchval()
+
+        # A player without a record on the chart gets the first page.
+        return position if position is not None else 1
 
     def get_play_count_ranking(self, top=200, day_start=None, day_end=None):
         def validate_date(date_str):
@@ -111,45 +156,12 @@ class ChartRankingManager:
             end_date = datetime.date.today()
             start_date = end_date - datetime.timedelta(days=60)
 
-        # 지정된 날짜의 23시 59분 59초까지 집계하기 위함.
-        end_date += datetime.timedelta(days=1)
-
-        top_clause = f"TOP {top}" if top else ""
-        query = f"""
-        WITH RankedPlaycounts AS (
-            SELECT
-                chart_id,
-                chart_difficulty,
-                playcount,
-                timestamp,
-                ROW_NUMBER() OVER (PARTITION BY chart_id, chart_difficulty ORDER BY timestamp) AS rn_asc,
-                ROW_NUMBER() OVER (PARTITION BY chart_id, chart_difficulty ORDER BY timestamp DESC) AS rn_desc
-            FROM dbo.O2JamPlaycounts
-            WHERE timestamp BETWEEN '{start_date}' AND '{end_date}'
-        ),
-        PlaycountDifference AS (
-            SELECT
-                chart_id,
-                chart_difficulty,
-                MAX(CASE WHEN rn_desc = 1 THEN playcount END) -
-                MAX(CASE WHEN rn_asc = 1 THEN playcount END) AS playcount_diff
-            FROM RankedPlaycounts
-            GROUP BY chart_id, chart_difficulty
-        )
-        SELECT {top_clause}
-            p.chart_id,
-            p.playcount_diff AS total_playcount,
-            mi.NoteLevel,
-            mm.Title,
-            ROW_NUMBER() OVER (ORDER BY p.playcount_diff DESC, mi.NoteLevel DESC) AS Rank
-        FROM PlaycountDifference AS p
-        JOIN dbo.o2jam_music_data AS mi ON mi.MusicCode = p.chart_id AND mi.Difficulty = p.chart_difficulty
-        JOIN dbo.o2jam_music_metadata AS mm ON mm.MusicCode = p.chart_id
-        WHERE p.playcount_diff > 0
-        """
-
-        with self._connection.cursor() as cursor:
-            cursor.execute(query)
+        reference_catalog.ensure_fresh(self._connection)
+
+        # top 0 lists every chart.
+        with self._connection.execute(
+            PLAY_COUNT_RANKING.sql(), (top or None, start_date, end_date)
+        ) as cursor:
             query_results = cursor.fetchall()
 
             if query_results is None:
@@ -163,8 +175,8 @@ class ChartRankingManager:
                         "chart_id": rank_info[0],
                         "playcount": rank_info[1],
                         "level": rank_info[2],
-                        "chart_title": rank_info[3],
-                        "rank_index": rank_info[4],
+                        "chart_title": reference_catalog.title(rank_info[0]),
+                        "rank_index": rank_info[3],
                     }
                 )
 
@@ -0,0 +1,262 @@
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from src.database.records import ChartSuggestion
+from src.database.reference_catalog import reference_catalog
+from src.database.refreshing_index import _RefreshingIndex
+from src.tools.ngrams import GRAM_LENGTH, fold, keyword_grams, text_grams
+
+# Record fields searched by each parse_search option.
+_SEARCH_FIELDS = (("title", "title"), ("artist", "artist"), ("mapper", "note_charter"))
+
+SUGGESTION_LIMIT = 10
+MAX_SUGGESTION_LIMIT = 50
+
+
+def _word_starts(text):
+    # Suggestions match the start of the whole text or of any word in it.
+    return [
+        i
+        for i in range(len(text))
+        if text[i].isalnum() and (i == 0 or not text[i - 1].isalnum())
+    ] or [0]
+
+
+class _ChartSearchData:
+    __slots__ = (
+        "entries",
+        "levels",
+        "texts",
+        "postings",
+        "complete_fields",
+        "suggestions",
+        "prefix_keys",
+        "prefix_targets",
+    )
+
+    def __init__(self, entries):
+        # entries are sorted by hard_level, levels[position] is the level of
+        # entries[position].
+        self.entries = entries
+        self.levels = array("q", (entry.hard_level for entry in entries))
+
+        # texts[field][position] is the folded field, or None for NULL,
+        # postings[field][gram] the positions whose field contains the gram.
+        self.texts = {}
+        self.postings = {}
+        # Fields without a NULL, an empty keyword matches every chart there.
+        self.complete_fields = set()
+
+        for _, field in _SEARCH_FIELDS:
+            texts = []
+            postings = {}
+
+            for position, entry in enumerate(entries):
+                value = getattr(entry, field)
+                text = fold(value) if value is not None else None
+                texts.append(text)
+
+                if text is not None:
+                    for gram in text_grams(text):
+                        postings.setdefault(gram, []).append(position)
+
+            self.texts[field] = texts
+
+            if None not in texts:
+                self.complete_fields.add(field)
+
+            self.postings[field] = {
+                gram: frozenset(positions) for gram, positions in postings.items()
+            }
+
+        # suggestions[id] is (field, text, positions of the charts having it),
+        # prefix_keys the sorted folded text from each word start on and
+        # prefix_targets[key] its (id, starts mid text).
+        grouped = {}
+
+        for _, field in _SEARCH_FIELDS:
+            for position, entry in enumerate(entries):
+                value = getattr(entry, field)
+
+                if value:
+                    grouped.setdefault((field, value), []).append(position)
+
+        self.suggestions = [
+            (field, value, array("l", positions))
+            for (field, value), positions in grouped.items()
+        ]
+
+        prefixes = sorted(
+            (text[start:], suggestion_id, start > 0)
+            for suggestion_id, (_, value, _) in enumerate(self.suggestions)
+            for text in (fold(value),)
+            for start in _word_starts(text)
+        )
+
+        self.prefix_keys = [key for key, _, _ in prefixes]
+        self.prefix_targets = [
+            (suggestion_id, mid_text) for _, suggestion_id, mid_text in prefixes
+        ]
+
+
+class ChartSearchIndex(_RefreshingIndex):
+    """Inverted n-gram index of the chart catalog, replacing LIKE '%keyword%'
+    over o2jam_music_metadata. It is rebuilt from the reference catalog
+    whenever that changes.
+
+    Matching is a substring test of the folded keyword against each
+    enabled field, like the LIKE conditions under the server's case, width
+    and kana insensitive collation, see ngrams.fold."""
+
+    def __init__(self):
+        # Checking the catalog costs no query, so it is done on every use.
+        super().__init__(float("inf"), 0.0)
+
+        self._data = _ChartSearchData([])
+        self._catalog_generation = None
+
+    def search(self, search_data):
+        data = self._data
+        options = search_data["options"]
+        lowest, highest = options["level"]
+
+        start = bisect_left(data.levels, lowest)
+        end = bisect_right(data.levels, highest)
+
+        if start >= end:
+            return []
+
+        fields = [field for option, field in _SEARCH_FIELDS if options[option]]
+
+        keyword = fold(search_data["keywords"])
+
+        if not fields or (not keyword and data.complete_fields.intersection(fields)):
+            # Every chart in the level range is a result.
+            return data.entries[start:end][::-1]
+
+        matches = set()
+
+        for field in fields:
+            candidates = self._candidates(data, field, keyword, start, end)
+
+            if 0 < len(keyword) <= GRAM_LENGTH:
+                # The keyword is a gram itself, its postings are exact.
+                matches.update(candidates)
+                continue
+
+            texts = data.texts[field]
+            matches.update(
+                position
+                for position in candidates
+                if texts[position] is not None and keyword in texts[position]
+            )
+
+        # Highest level first, like ORDER BY NoteLevel DESC.
+        return [data.entries[position] for position in sorted(matches, reverse=True)]
+
+    def suggest(self, search_data, limit=SUGGESTION_LIMIT):
+        # Texts starting with the keyword, or with a word starting with it,
+        # whole text matches and shorter texts first.
+        data = self._data
+        options = search_data["options"]
+        prefix = fold(search_data["keywords"].strip())
+
+        if not prefix:
+            return []
+
+        fields = {field for option, field in _SEARCH_FIELDS if options[option]}
+        lowest, highest = options["level"]
+        start = bisect_left(data.levels, lowest)
+        end = bisect_right(data.levels, highest)
+
+        keys = data.prefix_keys
+        best = {}
+
+        for i in range(bisect_left(keys, prefix), len(keys)):
+            if not keys[i].startswith(prefix):
+                break
+
+            suggestion_id, mid_text = data.prefix_targets[i]
+
+            if suggestion_id not in best or best[suggestion_id] > mid_text:
+                best[suggestion_id] = mid_text
+
+        ranked = sorted(
+            best,
+            key=lambda suggestion_id: (
+                best[suggestion_id],
+                len(data.suggestions[suggestion_id][1]),
+                data.suggestions[suggestion_id][1],
+            ),
+        )
+
+        suggestions = []
+
+        for suggestion_id in ranked:
+            field, value, positions = data.suggestions[suggestion_id]
+
+            if fields and field not in fields:
+                continue
+
+            # Positions are level ordered, so the charts in the level range
+            # are a slice of them.
+            chart_count = bisect_left(positions, end) - bisect_left(positions, start)
+
+            if chart_count:
+                suggestions.append(ChartSuggestion(value, field, chart_count))
+
+                if len(suggestions) == limit:
+                    break
+
+        return suggestions
+
+    @staticmethod
+    def _candidates(data, field, keyword, start, end):
+        if not keyword:
+            return range(start, end)
+
+        postings = data.postings[field]
+        gram_postings = []
+
+        for gram in keyword_grams(keyword):
+            positions = postings.get(gram)
+
+            if positions is None:
+                return ()
+
+            gram_postings.append(positions)
+
+        gram_postings.sort(key=len)
+        candidates = gram_postings[0].intersection(*gram_postings[1:])
+
+        return [position for position in candidates if start <= position < end]
+
+    def _rebuild(self, connection):
+        reference_catalog.ensure_fresh(connection)
+        catalog_generation = reference_catalog.generation
+        entries = reference_catalog.chart_entries()
+
+        if entries == self._data.entries:
+            data = self._data
+        else:
+            data = _ChartSearchData(entries)
+
+        with self._lock:
+            if data is not self._data:
+                self.generation += 1
+
+            self._data = data
+            self._catalog_generation = catalog_generation
+            self._built_at = self._refreshed_at = time.monotonic()
+
+    def _apply_updates(self, connection):
+        reference_catalog.ensure_fresh(connection)
+
+        if reference_catalog.generation != self._catalog_generation:
+            self._rebuild(connection)
+        else:
+            self._refreshed_at = time.monotonic()
+
+
+chart_search_index = ChartSearchIndex()
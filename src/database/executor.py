@@ -0,0 +1,91 @@
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+import pyodbc
+
+from src.database import DatabaseConnection
+
+
+class QueryDeadlineExceeded(Exception):
+    pass
+
+
+class QueryExecutor:
+    """Runs independent manager calls concurrently, each on its own pooled connection."""
+
+    def __init__(self, database_config):
+        fan_out_options = database_config.get("fan_out", {})
+
+        self._database_config = database_config
+        self._deadline = fan_out_options.get("deadline", 15.0)
+        self._executor = ThreadPoolExecutor(
+            max_workers=fan_out_options.get("max_workers", 8),
+            thread_name_prefix="oxygen-query",
+        )
+
+    def run(self, calls, deadline=None):
+        # calls : {name: callable taking a DatabaseConnection}
+        # Returns {name: result}, re-raises the first failure, and raises
+        # QueryDeadlineExceeded when results are not ready within the deadline.
+        if deadline is None:
+            deadline = self._deadline
+
+        futures = {
+            name: self._executor.submit(self._run_call, call)
+            for name, call in calls.items()
+        }
+
+        done, pending = wait(
+            futures.values(), timeout=deadline, return_when=FIRST_EXCEPTION
+        )
+
+        for future in done:
+            exception = future.exception()
+
+            if exception is not None:
+                self._cancel(pending)
+                raise exception
+
+        if pending:
+            self._cancel(pending)
+            raise QueryDeadlineExceeded(
+                f"{len(pending)} of {len(futures)} queries did not finish within {deadline}s"
+            )
+
+        return {name: future.result() for name, future in futures.items()}
+
+    def _run_call(self, call):
+        database = DatabaseConnection(self._database_config)
+        discard = False
+
+        try:
+            return call(database)
+        except pyodbc.Error:
+            # Only a driver error leaves the connection in doubt; e.g. the
+            # ValueError of a malformed page cursor is raised before any
+            # statement runs. Unread results are drained on checkin.
+            discard = True
+            raise
+        finally:
+            database.close(discard=discard)
+
+    @staticmethod
+    def _cancel(futures):
+        # Calls already running finish on their own and return their
+        # connections; only the queued ones can be dropped.
+        for future in futures:
+            future.cancel()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_query_executor(database_config):
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = QueryExecutor(database_config)
+
+        return _executor
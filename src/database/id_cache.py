@@ -0,0 +1,25 @@
+from src.config import ID_CACHE_CONFIG
+from src.tools.lru_cache import LruCache
+
+# Player ids looked up by nickname, login id and member id. Only nicknames
+# change, AccountManager.change_nickname invalidates the old and new one and
+# DatabaseUtils.nickname_to_usercode checks hits against the name index for
+# renames made elsewhere. Renames the index doesn't see until its rebuild
+# (not recorded in nickname_history) are bounded by the shorter nickname_ttl.
+nickname_ids = LruCache(
+    ID_CACHE_CONFIG["max_size"],
+    ID_CACHE_CONFIG["nickname_ttl"],
+    ID_CACHE_CONFIG["negative_ttl"],
+)
+login_ids = LruCache(
+    ID_CACHE_CONFIG["max_size"], ID_CACHE_CONFIG["ttl"], ID_CACHE_CONFIG["negative_ttl"]
+)
+member_ids = LruCache(
+    ID_CACHE_CONFIG["max_size"], ID_CACHE_CONFIG["ttl"], ID_CACHE_CONFIG["negative_ttl"]
+)
+
+
+def nickname_key(nickname):
+    # USER_NICKNAME = ? ignores case and trailing spaces under the server's
+    # collation, so the cache does too.
+    return nickname.rstrip().casefold()
@@ -1,173 +1,135 @@
+from src.database.memo import memoized
+from src.database.ranking_index import player_ranking_index
+from src.database.ranking_options import PlayerRankingOption
+from src.database.records import Computed, RowMapper, TierInfo
+from src.database.reference_catalog import reference_catalog
+from src.database.statements import PLAYER_PROFILE
+
+TIER_INFO_MAPPER = RowMapper(
+    TierInfo,
+    p_rank=0,
+    ss_rank=1,
+    s_rank=2,
+    a_rank=3,
+    b_rank=4,
+    c_rank=5,
+    d_rank=6,
+    cleared=7,
+    tier=Computed(lambda row, context: reference_catalog.tier_name(row[8])),
+)
+
+# {profile key: part of the profile it is read from}, the character row
+# ("player") is always read to tell whether the player exists.
+PLAYER_INFO_FIELDS = {
+    "nickname": "player",
+    "level": "player",
+    "play_count": "player",
+    "admin_level": "player",
+    "player_ranking": "ranking",
+    "current_view_difficulty": "player",
+    "tie_player_count": "ranking",
+    "player_code": "player",
+    "cleared_charts_count": "clear_count",
+    "last_access_time": "player",
+    "nickname_history": "nickname_history",
+    "badge_info": "badge_info",
+    "clear_history": "clear_history",
+}
+
+_PLAYER_PROFILE_QUERY_PARTS = (
+    "clear_count",
+    "nickname_history",
+    "badge_info",
+    "clear_history",
+)
+
+
 class InfoManager:
     def __init__(self, connection):
         self._connection = connection
 
-    def get_player_info(self, player_id, gauge_difficulty):
-        with self._connection.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT
-                    USER_NICKNAME,
-                    Level, 
-                    Battle,
-                    AdminLevel,
-                    USER_INDEX_ID,
-                    ISNULL(FORMAT(LastAccess, 'yy/MM/dd hh:mm tt', 'en-US'), 'NONE') as LastAccess
-                FROM
-                    dbo.T_o2jam_charinfo
-                WHERE
-                    USER_INDEX_ID = ?
-            """,
-                player_id,
-            )
-
-            raw_player_info = cursor.fetchone()
-
-            cursor.execute(
-                """
-                WITH Status AS (
-                    SELECT
-                        PlayerCode,
-                        RANK() OVER (
-                            ORDER BY
-                                Clear desc
-                        ) Ranking
-                    FROM
-                        dbo.O2JamStatus
-                )
-                SELECT
-                    Ranking
-                FROM
-                    Status
-                WHERE
-                    PlayerCode = ?
-            """,
-                player_id,
-            )
-
-            player_ranking = cursor.fetchval()
+    @memoized
+    def get_player_info(self, player_id, gauge_difficulty, fields=None):
+        # fields : names of the profile keys to return, None for all of them;
+        #          only the queries those keys need are run
+        if fields is None:
+            fields = PLAYER_INFO_FIELDS.keys()
 
-            if player_ranking is None:
-                player_ranking = 0
+        unknown_fields = set(fields) - PLAYER_INFO_FIELDS.keys()
 
-            cursor.execute(
-                """
-                SELECT
-                    COUNT(*)
-                FROM
-                    dbo.O2JamStatus
-                WHERE
-                    Clear=(SELECT Clear FROM dbo.O2JamStatus WHERE PlayerCode=?)
-            """,
-                player_id,
-            )
+        if unknown_fields:
+            raise ValueError(f"Unknown player info fields: {sorted(unknown_fields)}")
 
-            tie_player_count = cursor.fetchval()
+        parts = {PLAYER_INFO_FIELDS[field] for field in fields}
+        query = PLAYER_PROFILE.sql(
+            **{part: part in parts for part in _PLAYER_PROFILE_QUERY_PARTS}
+        )
 
-            cursor.execute(
-                """
-                SELECT
-                    COUNT(*)
-                FROM
-                    dbo.O2JamHighscore
-                WHERE
-                    PlayerCode = ? AND isClear=1 AND Difficulty=2
-            """,
-                player_id,
-            )
-
-            clear_count = cursor.fetchval()
+        with self._connection.execute(query, (player_id,)) as cursor:
+            # Every part of the profile comes back as its own result set,
+            # so the whole profile costs a single round trip.
+            raw_player_info = cursor.fetchone()
 
             if raw_player_info is None:
                 return None
 
-            cursor.execute(
-                """
-                SELECT
-                    Nickname
-                FROM
-                    dbo.nickname_history
-                WHERE
-                    player_id = ?
-                """,
-                player_id,
-            )
-
-            raw_nickname_history = cursor.fetchall()
-            nickname_history = []
-
-            for nickname in raw_nickname_history:
-                nickname_history.append(nickname[0])
-
-            cursor.execute(
-                """
-                SELECT
-                    b.badge_name,
-                    b.badge_css_tag,
-                    h.MusicCode
-                FROM 
-                    dbo.player_badge AS b
-                INNER JOIN
-                    dbo.O2JamHighscore AS h ON b.chart_id = h.MusicCode
-                INNER JOIN
-                    dbo.o2jam_music_data AS md ON md.MusicCode = h.MusicCode AND md.Difficulty = h.Difficulty
-                WHERE
-                    h.isClear = 1 AND h.Difficulty = 2 AND h.PlayerCode = ? 
-                ORDER BY
-                    b.badge_priority
-            """,
-                player_id,
-            )
-
-            raw_badge_info = cursor.fetchone()
-
-            if raw_badge_info is not None:
-                badge_info = {
-                    "badge_name": raw_badge_info[0],
-                    "badge_css_tag": raw_badge_info[1],
-                    "badge_chart_id": raw_badge_info[2],
-                }
-            else:
-                badge_info = None
-
-            cursor.execute(
-                """
-                SELECT
-                    CONVERT(char(10), date, 23), level
-                FROM
-                    status_clear_history
-                WHERE
-                    date >= CAST(DATEADD(day, -60, GETDATE()) AS DATE)
-                    AND player_id = ?
-                ORDER BY
-                    date
-                """,
-                player_id,
-            )
-
-            raw_clear_history = cursor.fetchall()
-            clear_history = {"date": [], "level": []}
-
-            for clear in raw_clear_history:
-                clear_history["date"].append(clear[0])
-                clear_history["level"].append(clear[1])
-
-            return {
+            player_info = {
                 "nickname": raw_player_info[0],
                 "level": raw_player_info[1],
                 "play_count": raw_player_info[2],
                 "admin_level": raw_player_info[3],
-                "player_ranking": player_ranking,
                 "current_view_difficulty": int(gauge_difficulty),
-                "tie_player_count": tie_player_count,
                 "player_code": raw_player_info[4],
-                "cleared_charts_count": clear_count,
                 "last_access_time": raw_player_info[5],
-                "nickname_history": nickname_history,
-                "badge_info": badge_info,
-                "clear_history": clear_history,
             }
 
+            if "clear_count" in parts:
+                cursor.nextset()
+                player_info["cleared_charts_count"] = cursor.fetchval()
+
+            if "nickname_history" in parts:
+                cursor.nextset()
+                player_info["nickname_history"] = [
+                    nickname[0] for nickname in cursor.fetchall()
+                ]
+
+            if "badge_info" in parts:
+                cursor.nextset()
+                raw_badge_info = cursor.fetchone()
+
+                if raw_badge_info is not None:
+                    player_info["badge_info"] = {
+                        "badge_name": raw_badge_info[0],
+                        "badge_css_tag": raw_badge_info[1],
+                        "badge_chart_id": raw_badge_info[2],
+                    }
+                else:
+                    player_info["badge_info"] = None
+
+            if "clear_history" in parts:
+                cursor.nextset()
+                clear_history = {"date": [], "level": []}
+
+                for clear in cursor.fetchall():
+                    clear_history["date"].append(clear[0])
+                    clear_history["level"].append(clear[1])
+
+                player_info["clear_history"] = clear_history
+
+        if "ranking" in parts:
+            # Rank and ties come from the in-memory index instead of two
+            # scans of O2JamStatus.
+            player_ranking_index.ensure_fresh(self._connection)
+            (
+                player_info["player_ranking"],
+                player_info["tie_player_count"],
+            ) = player_ranking_index.rank(
+                PlayerRankingOption.ORDER_CLEAR, raw_player_info[4]
+            )
+
+        return {field: player_info[field] for field in fields}
+
+    @memoized
     def get_tier_info(self, player_id):
         with self._connection.cursor() as cursor:
             cursor.execute(
@@ -181,10 +143,9 @@ class InfoManager:
                     s.C,
                     s.D,
                     s.Clear,
-                    t.tier_name
+                    s.Tier
                 FROM
                     dbo.O2JamStatus s
-                    LEFT OUTER JOIN dbo.TierInfo t ON s.Tier = t.tier_index
                 WHERE
                     PlayerCode = ?
             """,
@@ -196,57 +157,11 @@ class InfoManager:
             if raw_result is None:
                 return None
 
-            return {
-                "p_rank": raw_result[0],
-                "ss_rank": raw_result[1],
-                "s_rank": raw_result[2],
-                "a_rank": raw_result[3],
-                "b_rank": raw_result[4],
-                "c_rank": raw_result[5],
-                "d_rank": raw_result[6],
-                "cleared": raw_result[7],
-                "tier": raw_result[8],
-            }
+        reference_catalog.ensure_fresh(self._connection)
 
-    def get_music_info(self, music_id, gauge_difficulty):
-        with self._connection.cursor() as cursor:
-            cursor.execute(
-                """
-                SELECT
-                    m.MusicCode,
-                    title,
-                    artist,
-                    NoteCharter,
-                    bpm,
-                    NoteLevel,
-                    NoteCount,
-                    PlayCount
-                FROM
-                    dbo.o2jam_music_metadata AS m
-                LEFT OUTER JOIN
-                    dbo.o2jam_music_data AS mm ON mm.MusicCode = m.MusicCode AND mm.Difficulty = ?
-                WHERE
-                    m.MusicCode = ?
-            """,
-                (
-                    gauge_difficulty,
-                    music_id,
-                ),
-            )
-
-            raw_result = cursor.fetchone()
+        return TIER_INFO_MAPPER.map_row(raw_result)
 
-            if raw_result is None:
-                return None
+    def get_music_info(self, music_id, gauge_difficulty):
+        reference_catalog.ensure_fresh(self._connection)
 
-            return {
-                "music_code": raw_result[0],
-                "title": raw_result[1],
-                "artist": raw_result[2],
-                "note_charter": raw_result[3],
-                "bpm": round(float(raw_result[4])),
-                "difficulty": int(gauge_difficulty),
-                "level": raw_result[5],
-                "note_count": raw_result[6],
-                "play_count": raw_result[7],
-            }
+        return reference_catalog.music_info(music_id, gauge_difficulty)
@@ -0,0 +1,40 @@
+from functools import wraps
+
+
+class RequestMemo:
+    """Results of read-only manager calls made through one ConnectionLease,
+    dropped when the lease is released at the end of the request."""
+
+    def __init__(self):
+        self._results = {}
+
+    def get(self, key, load):
+        # load : callable computing the result, only called on a miss
+        try:
+            return self._results[key]
+        except KeyError:
+            result = self._results[key] = load()
+            return result
+
+    def clear(self):
+        self._results.clear()
+
+
+def memoized(method):
+    # Caches a read-only manager method by its arguments for the rest of
+    # the request, e.g. a page and its 404 check asking for the same
+    # profile run its queries once. Callers must not mutate the result.
+    name = method.__qualname__
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (name, args, tuple(sorted(kwargs.items())))
+
+        try:
+            hash(key)
+        except TypeError:
+            return method(self, *args, **kwargs)
+
+        return self._connection.memo.get(key, lambda: method(self, *args, **kwargs))
+
+    return wrapper
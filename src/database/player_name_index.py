@@ -0,0 +1,299 @@
+import datetime
+import time
+from bisect import bisect_left, insort
+
+from src.database.ranking_index import player_ranking_snapshot
+from src.database.refreshing_index import _RefreshingIndex
+from src.database.ranking_options import PlayerRankingOption
+from src.database.records import PlayerSearchEntry
+from src.tools.ngrams import GRAM_LENGTH, keyword_grams, text_grams
+
+PLAYER_SEARCH_LIMIT = 50
+
+# Match kinds, better matches first.
+_EXACT, _PREFIX, _FORMER_PREFIX, _SUBSTRING, _FORMER_SUBSTRING = range(5)
+
+
+class PlayerNameIndex(_RefreshingIndex):
+    """Current and past nicknames of every player for prefix and substring
+    search, replacing lookups of T_o2jam_charinfo and nickname_history.
+
+    New players and renames recorded in nickname_history are picked up
+    incrementally; renames done through AccountManager are applied as soon
+    as they commit."""
+
+    def __init__(self, rebuild_interval=3600.0, refresh_interval=30.0):
+        super().__init__(rebuild_interval, refresh_interval)
+
+        # {player_code: (nickname, (former nickname, ...))}
+        self._names = {}
+        # Sorted (case folded name, player_code) of every current and past name.
+        self._prefix_keys = []
+        # {gram: {player_code, ...}} over every current and past name.
+        self._postings = {}
+
+        self._history_watermark = None
+        self._last_player_code = 0
+
+    def search(self, keyword, limit=PLAYER_SEARCH_LIMIT):
+        # Players whose current or past nickname starts with or contains the
+        # keyword, case-insensitively. Exact matches come first, then prefix
+        # matches, then substring matches, current names before past ones.
+        keyword = keyword.strip().casefold()
+
+        if not keyword:
+            return []
+
+        with self._lock:
+            matches = {}
+
+            for i in range(
+                bisect_left(self._prefix_keys, (keyword,)), len(self._prefix_keys)
+            ):
+                name, player_code = self._prefix_keys[i]
+
+                if not name.startswith(keyword):
+                    break
+
+                self._add_match(matches, player_code, keyword, name)
+
+            for player_code in self._candidates(keyword):
+                if player_code in matches:
+                    continue
+
+                nickname, former_nicknames = self._names[player_code]
+
+                for name in (nickname, *former_nicknames):
+                    if name is not None and keyword in name.casefold():
+                        self._add_match(matches, player_code, keyword, name.casefold())
+
+            ranked = sorted(
+                matches.items(),
+                key=lambda match: (match[1][0], self._names[match[0]][0] or ""),
+            )[:limit]
+
+            results = [
+                (player_code, self._names[player_code][0], former_nickname)
+                for player_code, (_, former_nickname) in ranked
+            ]
+
+        entries = []
+
+        for row_number, (player_code, nickname, former_nickname) in enumerate(
+            results, start=1
+        ):
+            rank, tier = player_ranking_snapshot.standing(
+                PlayerRankingOption.ORDER_CLEAR, player_code
+            )
+            entries.append(
+                PlayerSearchEntry(
+                    player_code, nickname, former_nickname, tier, rank, row_number
+                )
+            )
+
+        return entries
+
+    def current_nickname(self, player_code):
+        # None for a player the index doesn't know yet.
+        with self._lock:
+            names = self._names.get(player_code)
+
+        return names[0] if names is not None else None
+
+    def rename(self, player_code, nickname):
+        # Applies a nickname change committed by this process, the former
+        # nickname moves to the player's history like in nickname_history.
+        with self._lock:
+            names = self._names.get(player_code)
+
+            if names is None or names[0] == nickname:
+                return
+
+            current, former_nicknames = names
+            self._replace_player(
+                player_code, (nickname, (*former_nicknames, current))
+            )
+            self.generation += 1
+
+    def _add_match(self, matches, player_code, keyword, folded_name):
+        nickname, former_nicknames = self._names[player_code]
+        is_current = nickname is not None and nickname.casefold() == folded_name
+
+        if is_current:
+            kind = _EXACT if folded_name == keyword else _PREFIX
+            former_nickname = None
+        else:
+            kind = _FORMER_PREFIX
+            former_nickname = next(
+                name
+                for name in former_nicknames
+                if name is not None and name.casefold() == folded_name
+            )
+
+        if not folded_name.startswith(keyword):
+            kind = _SUBSTRING if is_current else _FORMER_SUBSTRING
+
+        if player_code not in matches or matches[player_code][0] > kind:
+            matches[player_code] = (kind, former_nickname)
+
+    def _candidates(self, keyword):
+        gram_postings = []
+
+        for gram in keyword_grams(keyword):
+            player_codes = self._postings.get(gram)
+
+            if player_codes is None:
+                return set()
+
+            gram_postings.append(player_codes)
+
+        gram_postings.sort(key=len)
+
+        if len(keyword) <= GRAM_LENGTH:
+            return gram_postings[0]
+
+        return gram_postings[0].intersection(*gram_postings[1:])
+
+    def _rebuild(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SET NOCOUNT ON;
+
+                SELECT MAX(occur_date) FROM dbo.nickname_history;
+
+                SELECT USER_INDEX_ID, USER_NICKNAME FROM dbo.T_o2jam_charinfo;
+
+                SELECT player_id, nickname FROM dbo.nickname_history ORDER BY occur_date;
+            """
+            )
+
+            history_watermark = cursor.fetchval()
+            cursor.nextset()
+            current_rows = cursor.fetchall()
+            cursor.nextset()
+            history_rows = cursor.fetchall()
+
+        names = self._group_names(current_rows, history_rows)
+        prefix_keys = []
+        postings = {}
+
+        for player_code, (nickname, former_nicknames) in names.items():
+            for name in self._folded_names(nickname, former_nicknames):
+                prefix_keys.append((name, player_code))
+
+                for gram in text_grams(name):
+                    postings.setdefault(gram, set()).add(player_code)
+
+        prefix_keys.sort()
+
+        with self._lock:
+            if names != self._names:
+                self.generation += 1
+
+            self._names = names
+            self._prefix_keys = prefix_keys
+            self._postings = postings
+            # An empty history still gets a watermark to refresh from.
+            self._history_watermark = history_watermark or datetime.datetime(1900, 1, 1)
+            self._last_player_code = max(names, default=0)
+            self._built_at = self._refreshed_at = time.monotonic()
+
+    def _apply_updates(self, connection):
+        with connection.cursor() as cursor:
+            # New players, and players renamed since the last refresh with
+            # their whole history. Renames stamped exactly at the watermark
+            # are read again, which leaves the index unchanged.
+            cursor.execute(
+                """
+                SET NOCOUNT ON;
+
+                DECLARE @Since DATETIME = ?;
+                DECLARE @LastPlayerCode INT = ?;
+
+                SELECT MAX(occur_date) FROM dbo.nickname_history;
+
+                SELECT USER_INDEX_ID INTO #touched
+                FROM dbo.T_o2jam_charinfo
+                WHERE USER_INDEX_ID > @LastPlayerCode
+                UNION
+                SELECT player_id FROM dbo.nickname_history WHERE occur_date >= @Since;
+
+                SELECT c.USER_INDEX_ID, c.USER_NICKNAME
+                FROM dbo.T_o2jam_charinfo c
+                INNER JOIN #touched t ON t.USER_INDEX_ID = c.USER_INDEX_ID;
+
+                SELECT h.player_id, h.nickname
+                FROM dbo.nickname_history h
+                INNER JOIN #touched t ON t.USER_INDEX_ID = h.player_id
+                ORDER BY h.occur_date;
+
+                DROP TABLE #touched;
+            """,
+                (self._history_watermark, self._last_player_code),
+            )
+
+            history_watermark = cursor.fetchval()
+            cursor.nextset()
+            current_rows = cursor.fetchall()
+            cursor.nextset()
+            history_rows = cursor.fetchall()
+
+        names = self._group_names(current_rows, history_rows)
+
+        with self._lock:
+            for player_code, player_names in names.items():
+                if self._names.get(player_code) != player_names:
+                    self._replace_player(player_code, player_names)
+                    self.generation += 1
+
+            if history_watermark is not None:
+                self._history_watermark = history_watermark
+
+            self._last_player_code = max((self._last_player_code, *names))
+            self._refreshed_at = time.monotonic()
+
+    def _replace_player(self, player_code, new_names):
+        old_names = self._names.get(player_code)
+        old_folded = (
+            self._folded_names(*old_names) if old_names is not None else set()
+        )
+        new_folded = self._folded_names(*new_names)
+
+        for name in old_folded - new_folded:
+            del self._prefix_keys[bisect_left(self._prefix_keys, (name, player_code))]
+
+        for name in new_folded - old_folded:
+            insort(self._prefix_keys, (name, player_code))
+
+        old_grams = set().union(*map(text_grams, old_folded))
+        new_grams = set().union(*map(text_grams, new_folded))
+
+        for gram in old_grams - new_grams:
+            self._postings[gram].discard(player_code)
+
+        for gram in new_grams - old_grams:
+            self._postings.setdefault(gram, set()).add(player_code)
+
+        self._names[player_code] = new_names
+
+    @staticmethod
+    def _folded_names(nickname, former_nicknames):
+        return {
+            name.casefold() for name in (nickname, *former_nicknames) if name is not None
+        }
+
+    @staticmethod
+    def _group_names(current_rows, history_rows):
+        former_nicknames = {}
+
+        for player_code, nickname in history_rows:
+            former_nicknames.setdefault(player_code, []).append(nickname)
+
+        return {
+            player_code: (nickname, tuple(former_nicknames.get(player_code, ())))
+            for player_code, nickname in current_rows
+        }
+
+
+player_name_index = PlayerNameIndex()
@@ -1,287 +1,230 @@
-from enum import Enum
-
-
-class PlayerRankingOption(Enum):
-    ORDER_P = 0
-    ORDER_SS = 1
-    ORDER_S = 2
-    ORDER_A = 3
-    ORDER_B = 4
-    ORDER_C = 5
-    ORDER_D = 6
-    ORDER_CLEAR = 7
-    ORDER_PLAYCOUNT = 8
-
-
-class PeriodOption(Enum):
-    DAY_1 = 0
-    DAY_7 = 1
-    DAY_30 = 2
-    YEAR_HALF = 3
-    YEAR_1 = 4
+from src.database.ranking_index import player_ranking_snapshot, song_rank_index
+from src.database.records import (
+    Computed,
+    HistoryRecord,
+    RecentRecord,
+    RowMapper,
+    ScoreRecord,
+    optional_float,
+    row_number,
+)
+from src.database.ranking_options import PlayerRankingOption
+from src.database.reference_catalog import (
+    catalog_level,
+    catalog_progress_name,
+    catalog_title,
+    reference_catalog,
+)
+from src.database.statements import (
+    BEST_PLAY,
+    PLAYER_SCOREBOARD_RANGES,
+    PLAYER_TOP_RECORD_COUNT,
+    PLAYER_TOP_RECORDS,
+    RECENT_RECORDS,
+    RECORD_HISTORIES,
+)
+from src.tools.pagination import decode_cursor, encode_cursor
+from src.tools.record_table import RecordTable
+
+TOP_RECORDS_PAGE_SIZE = 100
+RECENT_RECORDS_PAGE_SIZE = 150
+RANKING_PAGE_SIZE = 100
+
+TOP_RECORD_MAPPER = RowMapper(
+    ScoreRecord,
+    player_code=0,
+    music_code=1,
+    music_title=catalog_title(1),
+    music_difficulty=2,
+    music_level=3,
+    score=4,
+    score_cool=5,
+    score_good=6,
+    score_bad=7,
+    score_miss=8,
+    score_max_combo=9,
+    progress=catalog_progress_name(10),
+    is_cleared_record=11,
+    cleared_time=12,
+    # Chart ranks come from the in-memory score index instead of a
+    # RANK() over every row of O2JamHighscore.
+    record_rank=Computed(
+        lambda row, context: song_rank_index.rank(row[1], row[2], row[4])
+    ),
+    pattern_order=13,
+    play_speed_rate=optional_float(14),
+    play_timing_rate=15,
+    fln_option=16,
+    sln_option=17,
+    is_nln=18,
+    row_number=row_number(19),
+)
+
+RECENT_RECORD_MAPPER = RowMapper(
+    RecentRecord,
+    music_code=0,
+    music_title=catalog_title(0),
+    cleared_time=1,
+    score=2,
+    progress=3,
+    is_cleared_record=4,
+    score_cool=5,
+    score_good=6,
+    score_bad=7,
+    score_miss=8,
+    score_max_combo=9,
+    pattern_order=10,
+    play_speed_rate=optional_float(11),
+    play_timing_rate=12,
+    fln_option=13,
+    sln_option=14,
+    is_nln=15,
+    music_level=catalog_level(0),
+    row_number=row_number(16),
+)
+
+HISTORY_RECORD_MAPPER = RowMapper(
+    HistoryRecord,
+    player_code=Computed(lambda row, context: context["player_id"]),
+    cleared_time=0,
+    score=1,
+    progress=2,
+    is_cleared_record=3,
+    score_cool=4,
+    score_good=5,
+    score_bad=6,
+    score_miss=7,
+    score_max_combo=8,
+    pattern_order=9,
+    play_speed_rate=optional_float(10),
+    play_timing_rate=11,
+    fln_option=12,
+    sln_option=13,
+    is_nln=14,
+    row_number=15,
+)
 
 
 class PlayerRankingManager:
     def __init__(self, connection):
         self._connection = connection
 
-    def get_player_top_records(self, player_id, gauge_difficulty, show_f_rank, page):
-        if show_f_rank:
-            view_option_query = "h.Score >= 70000"
-        else:
-            view_option_query = "h.isClear = 1"
-
-        with self._connection.cursor() as cursor:
-            cursor.execute(
-                f"""
-                    WITH RankedResults AS (
-                        SELECT
-                            h.PlayerCode,
-                            h.MusicCode,
-                            md.Title,
-                            h.Difficulty,
-                            d.NoteLevel,
-                            h.Score,
-                            h.Cool,
-                            h.Good,
-                            h.Bad,
-                            h.Miss,
-                            h.MaxCombo,
-                            p.progress_name,
-                            h.isClear,
-                            h.PlayedTime,
-                            h.PatternOrder,
-                            ROUND(h.PlaySpeedRate, 3) AS PlaySpeedRate,
-                            h.PlayTimingRate,
-                            h.FLNOption,
-                            h.SLNOption,
-                            h.isNLN,
-                            sr.SongRank AS SongRank,
-                            ROW_NUMBER() OVER (
-                                ORDER BY d.NoteLevel DESC, h.Score DESC
-                            ) AS RowNumber
-                        FROM dbo.O2JamHighscore h
-                        INNER JOIN dbo.o2jam_music_data d
-                            ON d.MusicCode = h.MusicCode
-                            AND d.Difficulty = h.Difficulty
-                        LEFT JOIN dbo.o2jam_music_metadata md
-                            ON md.MusicCode = h.MusicCode
-                        LEFT JOIN dbo.ProgressInfo p
-                            ON p.progress_index = h.Progress
-                        LEFT JOIN (
-                            SELECT
-                                PlayerCode,
-                                MusicCode,
-                                Difficulty,
-                                RANK() OVER (
-                                    PARTITION BY MusicCode, Difficulty
-                                    ORDER BY Score DESC
-                                ) AS SongRank
-                            FROM dbo.O2JamHighscore
-                        ) sr ON sr.PlayerCode = h.PlayerCode AND
-                                sr.MusicCode = h.MusicCode AND
-                                sr.Difficulty = h.Difficulty
-                        WHERE h.PlayerCode = ?
-                            AND h.Difficulty = ?
-                            AND {view_option_query}
-                    )
-                    SELECT
-                        PlayerCode,
-                        MusicCode,
-                        Title,
-                        Difficulty,
-                        NoteLevel,
-                        Score,
-                        Cool,
-                        Good,
-                        Bad,
-                        Miss,
-                        MaxCombo,
-                        progress_name,
-                        isClear,
-                        FORMAT(PlayedTime, 'yyyy-MM-dd hh:mm tt', 'en-US') AS PlayedTime,
-                        SongRank,
-                        PatternOrder,
-                        PlaySpeedRate,
-                        PlayTimingRate,
-                        FLNOption,
-                        SLNOption,
-                        isNLN,
-                        RowNumber
-                    FROM RankedResults
-                    {"WHERE RowNumber BETWEEN ? * 100 + 1 AND (? + 1) * 100" if page is not None else ""}
-                    ORDER BY RowNumber;
-                """,
-                (player_id, gauge_difficulty, page, page)
-                if page is not None
-                else (player_id, gauge_difficulty),
+    def get_player_top_records(
+        self, player_id, gauge_difficulty, show_f_rank, page, after=None, as_table=False
+    ):
+        # after : continuation token of a previous page. Pages after it are
+        # found by seeking past its (NoteLevel, Score, MusicCode) instead of
+        # numbering every record in front of it.
+        # as_table : return the records as a RecordTable
+        view = "f_rank" if show_f_rank else "cleared"
+        params = [player_id, gauge_difficulty]
+        seek = "none"
+        row_offset = 0
+
+        if after is not None:
+            last_level, last_score, last_music_code, row_offset = decode_cursor(
+                after, 4
+            )
+            seek = "after"
+            params.extend(
+                [
+                    last_level,
+                    last_level,
+                    last_score,
+                    last_level,
+                    last_score,
+                    last_music_code,
+                ]
             )
+            page_variant = "next"
+            params.append(TOP_RECORDS_PAGE_SIZE)
+        elif page is not None:
+            page_variant = "number"
+            params.extend(
+                [page, TOP_RECORDS_PAGE_SIZE, page, TOP_RECORDS_PAGE_SIZE]
+            )
+        else:
+            page_variant = "all"
 
+        with self._connection.execute(
+            PLAYER_TOP_RECORDS.sql(view=view, seek=seek, page=page_variant), params
+        ) as cursor:
             raw_records = cursor.fetchall()
-            response = []
 
-            for record in raw_records:
-                response.append(
-                    {
-                        "player_code": record[0],
-                        "music_code": record[1],
-                        "music_title": record[2],
-                        "music_difficulty": record[3],
-                        "music_level": record[4],
-                        "score": record[5],
-                        "score_cool": record[6],
-                        "score_good": record[7],
-                        "score_bad": record[8],
-                        "score_miss": record[9],
-                        "score_max_combo": record[10],
-                        "progress": record[11],
-                        "is_cleared_record": record[12],
-                        "cleared_time": record[13],
-                        "record_rank": record[14],
-                        "pattern_order": record[15],
-                        "play_speed_rate": float(record[16])
-                        if record[16] is not None
-                        else None,
-                        "play_timing_rate": record[17],
-                        "fln_option": record[18],
-                        "sln_option": record[19],
-                        "is_nln": record[20],
-                        "row_number": record[21],
-                    }
+        song_rank_index.ensure_fresh(self._connection)
+        reference_catalog.ensure_fresh(self._connection)
+        records = TOP_RECORD_MAPPER.map_rows(raw_records, row_offset=row_offset)
+
+        if len(records) == 0:
+            return None
+
+        next_cursor = None
+
+        if page_variant != "all" and len(records) == TOP_RECORDS_PAGE_SIZE:
+            last_record = records[-1]
+            next_cursor = encode_cursor(
+                (
+                    last_record.music_level,
+                    last_record.score,
+                    last_record.music_code,
+                    last_record.row_number,
                 )
+            )
+
+        table = RecordTable(ScoreRecord, records, next_cursor)
 
-            if len(response) == 0:
-                return None
+        return table if as_table else table.to_records()
 
-            return response
+    def iter_player_top_records(self, player_id, gauge_difficulty, show_f_rank):
+        # Unpaged scoreboard, read in chunks so a streamed response never
+        # holds the whole board in memory.
+        view = "f_rank" if show_f_rank else "cleared"
+
+        song_rank_index.ensure_fresh(self._connection)
+        reference_catalog.ensure_fresh(self._connection)
+
+        with self._connection.execute(
+            PLAYER_TOP_RECORDS.sql(view=view, seek="none", page="all"),
+            [player_id, gauge_difficulty],
+        ) as cursor:
+            yield from TOP_RECORD_MAPPER.iter_records(cursor)
 
     def get_player_top_records_count(self, player_id, gauge_difficulty, show_f_rank):
-        if show_f_rank:
-            view_option_query = "Score >= 70000"
-        else:
-            view_option_query = "isClear = 1"
-
-        with self._connection.cursor() as cursor:
-            cursor.execute(
-                f"""
-                    SELECT COUNT(PlayerCode)
-                    FROM dbo.O2JamHighscore
-                    WHERE PlayerCode = ?
-                          AND Difficulty = ?
-                          AND {view_option_query}
-                """,
-                (player_id, gauge_difficulty),
-            )
+        view = "f_rank" if show_f_rank else "cleared"
 
+        with self._connection.execute(
+            PLAYER_TOP_RECORD_COUNT.sql(view=view), (player_id, gauge_difficulty)
+        ) as cursor:
             return cursor.fetchval()
         
     def get_player_scoreboard_ranges(self, player_id, gauge_difficulty, paging_range, show_f_rank):
-        view_option_query = "h.Score >= 70000" if show_f_rank else "h.isClear = 1"
-
-        with self._connection.cursor() as cursor:
-            cursor.execute(
-                f"""
-                    WITH RankedResults AS (
-                        SELECT
-                            d.NoteLevel,
-                            CEILING(CAST(ROW_NUMBER() OVER (ORDER BY d.NoteLevel DESC, h.Score DESC) AS FLOAT) / ?) AS page_num
-                        FROM dbo.O2JamHighscore h
-                        INNER JOIN dbo.o2jam_music_data d ON d.MusicCode = h.MusicCode AND d.Difficulty = h.Difficulty
-                        WHERE h.PlayerCode = ? AND h.Difficulty = ? AND {view_option_query}
-                    )
-                    SELECT page_num, MIN(NoteLevel) as min_level, MAX(NoteLevel) as max_level
-                    FROM RankedResults
-                    GROUP BY page_num
-                    ORDER BY page_num
-                """,
-                (paging_range, player_id, gauge_difficulty)
-            )
-            
+        view = "f_rank" if show_f_rank else "cleared"
+
+        with self._connection.execute(
+            PLAYER_SCOREBOARD_RANGES.sql(view=view),
+            (paging_range, player_id, gauge_difficulty),
+        ) as cursor:
             return [{"page": r[0], "min_level": r[1], "max_level": r[2]} for r in cursor.fetchall()]
 
-    def get_player_ranking(self, sort_option: int):
+    def get_player_ranking(self, sort_option: int, offset=0, limit=None, around=None):
+        # Served from a snapshot of every category rebuilt once a minute, so
+        # requests never re-sort the status table.
+        # around : player code to center the page on, ignored if unranked.
         sort_option = PlayerRankingOption(sort_option)
+        player_ranking_snapshot.ensure_fresh(self._connection)
 
-        with self._connection.cursor() as cursor:
-            if sort_option == PlayerRankingOption.ORDER_PLAYCOUNT:
-                cursor.execute(
-                    """
-                SELECT 
-                    c.USER_INDEX_ID, 
-                    c.USER_NICKNAME, 
-                    c.Battle, 
-                    t.tier_name,
-                    RANK() OVER (ORDER BY battle desc) RowNum
-                FROM 
-                    dbo.T_o2jam_charinfo c 
-                    LEFT OUTER JOIN dbo.O2JamStatus s on s.PlayerCode = c.USER_INDEX_ID 
-                    LEFT OUTER JOIN dbo.TierInfo t on s.Tier = t.tier_index
-            """
-                )
-            elif sort_option == PlayerRankingOption.ORDER_CLEAR:
-                cursor.execute(
-                    f"""
-                            SELECT
-                                s.PlayerCode, 
-                                c.USER_NICKNAME, 
-                                s.{self._ranking_option_to_string(sort_option)},
-                                t.tier_name,
-                                RANK() OVER (
-                                    ORDER BY
-                                        s.{self._ranking_option_to_string(sort_option)} desc,
-                                        s.D desc,
-                                        s.C desc,
-                                        s.B desc,
-                                        s.A desc,
-                                        s.S desc,
-                                        s.SS desc,
-                                        s.P desc,
-                                        s.UpdatedTime desc
-                                ) RowNum
-                            FROM 
-                                dbo.O2JamStatus s
-                                LEFT OUTER JOIN dbo.T_o2jam_charinfo c on s.PlayerCode = c.USER_INDEX_ID 
-                                LEFT OUTER JOIN dbo.TierInfo t on s.Tier = t.tier_index
-                        """
-                )
-            else:
-                cursor.execute(
-                    f"""
-                SELECT
-                    s.PlayerCode, 
-                    c.USER_NICKNAME, 
-                    s.{self._ranking_option_to_string(sort_option)},
-                    t.tier_name,
-                    RANK() OVER (
-                        ORDER BY
-                            s.{self._ranking_option_to_string(sort_option)} desc,
-                            s.UpdatedTime desc
-                    ) RowNum
-                FROM 
-                    dbo.O2JamStatus s
-                    LEFT OUTER JOIN dbo.T_o2jam_charinfo c on s.PlayerCode = c.USER_INDEX_ID 
-                    LEFT OUTER JOIN dbo.TierInfo t on s.Tier = t.tier_index
-            """
-                )
+        if around is not None:
+            position = player_ranking_snapshot.position(sort_option, around)
 
-            raw_records = cursor.fetchall()
-            player_informations = []
-
-            for player_information in raw_records:
-                player_informations.append(
-                    {
-                        "player_code": player_information[0],
-                        "player_nickname": player_information[1],
-                        "rank": player_information[2],
-                        "tier": player_information[3],
-                        "row_number": player_information[4],
-                    }
-                )
+            if position is not None:
+                offset = max(position - (limit or 0) // 2, 0)
 
-            return {
-                "player_infos": player_informations,
-                "current_option_name": self._ranking_option_to_string(sort_option),
-            }
+        return {
+            "player_infos": player_ranking_snapshot.page(sort_option, offset, limit),
+            "current_option_name": self._ranking_option_to_string(sort_option),
+            "total_count": player_ranking_snapshot.count(sort_option),
+            "offset": offset,
+        }
 
     @staticmethod
     def _ranking_option_to_string(ranking_option):
@@ -307,160 +250,57 @@ class PlayerRankingManager:
             case _:
                 return "Unknown"
 
-    def get_record_histories(self, player_id, chart_id, difficulty, order_by_date):
-        if order_by_date:
-            order_query = "PlayedTime DESC"
-        else:
-            order_query = "Score DESC"
-
-        with self._connection.cursor() as cursor:
-            cursor.execute(
-                f"""
-                    SELECT TOP 50
-                        FORMAT(PlayedTime, 'yyyy-MM-dd hh:mm tt', 'en-US') AS PlayedTime,
-                        Score,
-                        Progress,
-                        isClear,
-                        Cool,
-                        Good,
-                        Bad,
-                        Miss,
-                        MaxCombo,
-                        PatternOrder,
-                        ROUND(PlaySpeedRate, 3) AS PlaySpeedRate,
-                        PlayTimingRate,
-                        FLNOption,
-                        SLNOption,
-                        isNLN,
-                        RowNum
-                    FROM (
-                        SELECT *,
-                               ROW_NUMBER() OVER (
-                                   PARTITION BY isClear
-                                   ORDER BY 
-                                       CASE 
-                                           WHEN isClear = 1 THEN Score
-                                           ELSE Cool + Good + Bad + Miss
-                                       END DESC
-                               ) AS RowNum
-                        FROM dbo.O2JamPlaylog
-                        WHERE PlayerCode = ? AND MusicCode = ? AND Difficulty = ?
-                    ) RankedScores
-                    ORDER BY {order_query}
-                """,
-                (player_id, chart_id, difficulty),
-            )
-
+    def get_record_histories(
+        self, player_id, chart_id, difficulty, order_by_date, as_table=False
+    ):
+        with self._connection.execute(
+            RECORD_HISTORIES.sql(order="date" if order_by_date else "score"),
+            (player_id, chart_id, difficulty),
+        ) as cursor:
             query_results = cursor.fetchall()
 
-        if query_results is None:
-            return []
-
-        response = []
-
-        for rank_info in query_results:
-            response.append(
-                {
-                    "player_code": player_id,
-                    "cleared_time": rank_info[0],
-                    "score": rank_info[1],
-                    "progress": rank_info[2],
-                    "is_cleared_record": rank_info[3],
-                    "score_cool": rank_info[4],
-                    "score_good": rank_info[5],
-                    "score_bad": rank_info[6],
-                    "score_miss": rank_info[7],
-                    "score_max_combo": rank_info[8],
-                    "pattern_order": rank_info[9],
-                    "play_speed_rate": float(rank_info[10])
-                    if rank_info[10] is not None
-                    else None,
-                    "play_timing_rate": rank_info[11],
-                    "fln_option": rank_info[12],
-                    "sln_option": rank_info[13],
-                    "is_nln": rank_info[14],
-                    "row_number": rank_info[15],
-                }
-            )
-
-        return response
-
-    def get_recent_records(self, player_id, difficulty, show_f_rank):
-        view_option_query = ""
-
-        if not show_f_rank:
-            view_option_query = "AND isClear = 1"
-
-        with self._connection.cursor() as cursor:
-            cursor.execute(
-                f"""
-                    SELECT TOP 150
-                        p.MusicCode,
-                        mi.Title,
-                        FORMAT(PlayedTime, 'yyyy-MM-dd hh:mm tt', 'en-US') AS PlayedTime,
-                        Score,
-                        Progress,
-                        isClear,
-                        Cool,
-                        Good,
-                        Bad,
-                        Miss,
-                        MaxCombo,
-                        PatternOrder,
-                        ROUND(PlaySpeedRate, 3) AS PlaySpeedRate,
-                        PlayTimingRate,
-                        FLNOption,
-                        SLNOption,
-                        isNLN,
-                        md.NoteLevel,
-                        ROW_NUMBER() OVER (ORDER BY PlayedTime DESC) RowNum
-                    FROM dbo.O2JamPlaylog AS p
-                    RIGHT OUTER JOIN dbo.o2jam_music_data AS md ON p.MusicCode = md.MusicCode AND p.Difficulty = md.Difficulty
-                    RIGHT OUTER JOIN dbo.o2jam_music_metadata AS mi ON mi.MusicCode = p.MusicCode
-                    WHERE
-                        PlayerCode = ?
-                        AND p.Difficulty = ?
-                        AND PlayedTime > DATEADD(day, -15, GETDATE())
-                        {view_option_query}
-                """,
-                (player_id, difficulty),
-            )
-
+        table = RecordTable(
+            HistoryRecord,
+            HISTORY_RECORD_MAPPER.map_rows(query_results, player_id=player_id),
+        )
+
+        return table if as_table else table.to_records()
+
+    def get_recent_records(
+        self, player_id, difficulty, show_f_rank, after=None, as_table=False
+    ):
+        # after : continuation token of a previous page, seeking past its
+        # (PlayedTime, id) so any page costs the same as the first one.
+        view = "f_rank" if show_f_rank else "cleared"
+        params = [RECENT_RECORDS_PAGE_SIZE, player_id, difficulty]
+        seek = "none"
+        row_offset = 0
+
+        if after is not None:
+            last_played_time, last_play_id, row_offset = decode_cursor(after, 3)
+            seek = "after"
+            params.extend([last_played_time, last_played_time, last_play_id])
+
+        with self._connection.execute(
+            RECENT_RECORDS.sql(view=view, seek=seek), params
+        ) as cursor:
             query_results = cursor.fetchall()
 
-            if query_results is None:
-                return []
+        reference_catalog.ensure_fresh(self._connection)
+        records = RECENT_RECORD_MAPPER.map_rows(
+            query_results, row_offset=row_offset, difficulty=int(difficulty)
+        )
+        next_cursor = None
 
-            response = []
+        if len(query_results) == RECENT_RECORDS_PAGE_SIZE:
+            last_record = query_results[-1]
+            next_cursor = encode_cursor(
+                (last_record[1], last_record[17], last_record[16] + row_offset)
+            )
 
-            for rank_info in query_results:
-                response.append(
-                    {
-                        "music_code": rank_info[0],
-                        "music_title": rank_info[1],
-                        "cleared_time": rank_info[2],
-                        "score": rank_info[3],
-                        "progress": rank_info[4],
-                        "is_cleared_record": rank_info[5],
-                        "score_cool": rank_info[6],
-                        "score_good": rank_info[7],
-                        "score_bad": rank_info[8],
-                        "score_miss": rank_info[9],
-                        "score_max_combo": rank_info[10],
-                        "pattern_order": rank_info[11],
-                        "play_speed_rate": float(rank_info[12])
-                        if rank_info[12] is not None
-                        else None,
-                        "play_timing_rate": rank_info[13],
-                        "fln_option": rank_info[14],
-                        "sln_option": rank_info[15],
-                        "is_nln": rank_info[16],
-                        "music_level": rank_info[17],
-                        "row_number": rank_info[18],
-                    }
-                )
+        table = RecordTable(RecentRecord, records, next_cursor)
 
-            return response
+        return table if as_table else table.to_records()
 
     def get_best_play(self, player_id, sort_option=PlayerRankingOption.ORDER_CLEAR):
         if sort_option == PlayerRankingOption.ORDER_PLAYCOUNT:
@@ -468,29 +308,16 @@ class PlayerRankingManager:
 
         if sort_option == PlayerRankingOption.ORDER_CLEAR:
             record_count = 8
-            option_string = "AND isClear = 1"
+            view = "cleared"
         else:
             record_count = 10
-            option_string = ""
-
-        with self._connection.cursor() as cursor:
-            cursor.execute(
-                f"""
-                SELECT TOP {record_count} mm.Title,
-                             m.NoteLevel,
-                             m.MusicCode
-                  FROM dbo.O2JamHighscore AS h
-             LEFT JOIN dbo.o2jam_music_data AS m ON m.MusicCode = h.MusicCode AND m.Difficulty = 2
-             LEFT JOIN dbo.o2jam_music_metadata AS mm ON mm.MusicCode = h.MusicCode
-                 WHERE h.PlayerCode = ?
-                   AND h.Progress <= ?
-                   AND h.Difficulty = 2
-                   {option_string}
-                 ORDER BY m.NoteLevel DESC
-            """,
-                (player_id, sort_option.value + 1),
-            )
+            view = "any"
+
+        reference_catalog.ensure_fresh(self._connection)
 
+        with self._connection.execute(
+            BEST_PLAY.sql(view=view), (record_count, player_id, sort_option.value + 1)
+        ) as cursor:
             query_results = cursor.fetchall()
 
             response = []
@@ -498,9 +325,9 @@ class PlayerRankingManager:
             for rank_info in query_results:
                 response.append(
                     {
-                        "title": rank_info[0],
-                        "level": rank_info[1],
-                        "id": rank_info[2],
+                        "title": reference_catalog.title(rank_info[1]),
+                        "level": rank_info[0],
+                        "id": rank_info[1],
                     }
                 )
 
@@ -0,0 +1,341 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pyodbc
+
+from src.database.memo import RequestMemo
+from src.database.statements import record_execution, record_repetition
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class _PooledConnection:
+    __slots__ = ("raw", "created_at", "last_used", "statement_cursors")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        # pyodbc keeps the last statement a cursor prepared, so a cursor per
+        # statement text runs it again without preparing it again.
+        self.statement_cursors = {}
+
+
+def _drain(cursor):
+    # Skips the rows and result sets a caller left unread. Without MARS,
+    # SQL Server refuses the next statement on the connection while any
+    # result set is still pending.
+    while cursor.nextset():
+        pass
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        connection_string,
+        pool_size=8,
+        checkout_timeout=10.0,
+        ping_interval=30.0,
+        recycle=3600.0,
+    ):
+        self._connection_string = connection_string
+        self._pool_size = pool_size
+        self._checkout_timeout = checkout_timeout
+        self._ping_interval = ping_interval
+        self._recycle = recycle
+
+        self._condition = threading.Condition()
+        self._idle = deque()
+        self._open_count = 0
+        self._in_use = 0
+
+        self._peak_in_use = 0
+        self._checkouts = 0
+        self._waited_checkouts = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def checkout(self):
+        started = time.monotonic()
+        deadline = started + self._checkout_timeout
+        pooled = None
+
+        with self._condition:
+            waited = False
+
+            while True:
+                if self._idle:
+                    # LIFO keeps the most recently used connections warm and
+                    # lets the rest age out through the recycle check.
+                    pooled = self._idle.pop()
+                    break
+
+                if self._open_count < self._pool_size:
+                    self._open_count += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(
+                        f"No database connection available within {self._checkout_timeout}s"
+                    )
+
+                waited = True
+                self._condition.wait(remaining)
+
+            wait_time = time.monotonic() - started
+
+            self._checkouts += 1
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+            self._total_wait += wait_time
+            self._max_wait = max(self._max_wait, wait_time)
+
+            if waited:
+                self._waited_checkouts += 1
+
+        try:
+            if pooled is not None and not self._is_usable(pooled):
+                self._close_quietly(pooled)
+                pooled = None
+
+                with self._condition:
+                    self._discarded += 1
+
+            if pooled is None:
+                pooled = _PooledConnection(pyodbc.connect(self._connection_string))
+        except Exception:
+            with self._condition:
+                self._open_count -= 1
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+
+        return pooled
+
+    def checkin(self, pooled, discard=False):
+        if not discard:
+            # Leave no pending results or open transaction behind for the
+            # next borrower.
+            try:
+                for cursor in pooled.statement_cursors.values():
+                    _drain(cursor)
+
+                pooled.raw.rollback()
+            except pyodbc.Error:
+                discard = True
+
+        if discard:
+            self._close_quietly(pooled)
+
+        with self._condition:
+            self._in_use -= 1
+
+            if discard:
+                self._open_count -= 1
+                self._discarded += 1
+            else:
+                pooled.last_used = time.monotonic()
+                self._idle.append(pooled)
+
+            self._condition.notify()
+
+    def statistics(self):
+        with self._condition:
+            return {
+                "pool_size": self._pool_size,
+                "open": self._open_count,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "peak_in_use": self._peak_in_use,
+                "checkouts": self._checkouts,
+                "waited_checkouts": self._waited_checkouts,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+                "average_wait_ms": round(
+                    self._total_wait / self._checkouts * 1000, 3
+                )
+                if self._checkouts
+                else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 3),
+            }
+
+    def dispose(self):
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open_count -= len(idle)
+
+        for pooled in idle:
+            self._close_quietly(pooled)
+
+    def _is_usable(self, pooled):
+        now = time.monotonic()
+
+        if now - pooled.created_at > self._recycle:
+            return False
+
+        if now - pooled.last_used < self._ping_interval:
+            return True
+
+        try:
+            with pooled.raw.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+            return True
+        except pyodbc.Error:
+            return False
+
+    @staticmethod
+    def _close_quietly(pooled):
+        try:
+            pooled.raw.close()
+        except pyodbc.Error:
+            return
+
+
+class _TrackedCursor:
+    """Cursor counting the statements it runs into its lease."""
+
+    __slots__ = ("_cursor", "_issued")
+
+    def __init__(self, cursor, issued):
+        self._cursor = cursor
+        self._issued = issued
+
+    def execute(self, sql, *params):
+        _count_issue(self._issued, sql, params)
+        self._cursor.execute(sql, *params)
+
+        return self
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._cursor.__exit__(*exc_info)
+
+
+def _count_issue(issued, sql, params):
+    key = (sql, repr(params))
+    issued[key] = issued.get(key, 0) + 1
+
+
+class ConnectionLease:
+    """Checks a connection out of the pool on first use and hands it back on release."""
+
+    def __init__(self, pool, track_repetitions=False):
+        # track_repetitions : count statements run more than once with the
+        #                     same parameters before the lease is released
+        self._pool = pool
+        self._pooled = None
+        self._broken = False
+        self._issued = {} if track_repetitions else None
+
+        # Results of @memoized manager calls made through this lease.
+        self.memo = RequestMemo()
+
+    def cursor(self):
+        cursor = self._acquire().cursor()
+
+        if self._issued is not None:
+            return _TrackedCursor(cursor, self._issued)
+
+        return cursor
+
+    @contextmanager
+    def execute(self, sql, params=()):
+        # Runs a statement of src/database/statements.py on the cursor
+        # already prepared for it on this connection. Whatever the with
+        # block leaves unread is drained when it ends, e.g. an early return
+        # or a stream the client walked away from.
+        self._acquire()
+        cursor = self._pooled.statement_cursors.get(sql)
+
+        if cursor is None:
+            cursor = self._pooled.raw.cursor()
+            self._pooled.statement_cursors[sql] = cursor
+
+        record_execution(sql)
+
+        if self._issued is not None:
+            _count_issue(self._issued, sql, (params,))
+
+        try:
+            cursor.execute(sql, params)
+            yield cursor
+        finally:
+            try:
+                _drain(cursor)
+            except pyodbc.Error:
+                # The connection can't be trusted with the next statement.
+                self._broken = True
+
+    def commit(self):
+        if self._pooled is not None:
+            self._pooled.raw.commit()
+
+    def rollback(self):
+        if self._pooled is not None:
+            self._pooled.raw.rollback()
+
+    def release(self, discard=False):
+        self.memo.clear()
+
+        if self._issued:
+            for (sql, _), count in self._issued.items():
+                if count > 1:
+                    record_repetition(sql, count - 1)
+
+            self._issued.clear()
+
+        pooled, self._pooled = self._pooled, None
+        discard = discard or self._broken
+        self._broken = False
+
+        if pooled is not None:
+            self._pool.checkin(pooled, discard)
+
+    def _acquire(self):
+        if self._pooled is None:
+            self._pooled = self._pool.checkout()
+
+        return self._pooled.raw
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name, connection_string, options):
+    with _pools_lock:
+        pool = _pools.get(name)
+
+        if pool is None:
+            pool = ConnectionPool(connection_string, **options)
+            _pools[name] = pool
+
+        return pool
+
+
+def pool_statistics():
+    with _pools_lock:
+        pools = dict(_pools)
+
+    return {name: pool.statistics() for name, pool in pools.items()}
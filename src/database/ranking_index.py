@@ -0,0 +1,615 @@
+import datetime
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from src.database.ranking_options import PlayerRankingOption
+from src.database.records import RankingEntry
+from src.database.reference_catalog import reference_catalog
+from src.database.refreshing_index import _RefreshingIndex
+from src.database.snapshot_store import snapshot_store
+
+# Column order of every row loaded into the index, after PlayerCode.
+_INDEXED_OPTIONS = (
+    PlayerRankingOption.ORDER_P,
+    PlayerRankingOption.ORDER_SS,
+    PlayerRankingOption.ORDER_S,
+    PlayerRankingOption.ORDER_A,
+    PlayerRankingOption.ORDER_B,
+    PlayerRankingOption.ORDER_C,
+    PlayerRankingOption.ORDER_D,
+    PlayerRankingOption.ORDER_CLEAR,
+    PlayerRankingOption.ORDER_PLAYCOUNT,
+)
+
+
+_NO_WATERMARK = datetime.datetime(1900, 1, 1)
+
+# Player code, the _INDEXED_OPTIONS values and the status watermark column.
+_PLAYER_VALUES_COLUMNS = """COALESCE(s.PlayerCode, c.USER_INDEX_ID),
+                    s.P,
+                    s.SS,
+                    s.S,
+                    s.A,
+                    s.B,
+                    s.C,
+                    s.D,
+                    s.Clear,
+                    c.Battle,
+                    s.UpdatedTime"""
+
+
+class PlayerRankingIndex(_RefreshingIndex):
+    """Sorted per-category values of O2JamStatus for bisect based rank lookups."""
+
+    def __init__(self, rebuild_interval=600.0, refresh_interval=30.0):
+        super().__init__(rebuild_interval, refresh_interval)
+
+        self._values = {option: array("q") for option in _INDEXED_OPTIONS}
+        self._player_values = {}
+        # Deltas are read from three sources: O2JamStatus.UpdatedTime for the
+        # grades and clears, O2JamPlaylog.PlayedTime for Battle (play count),
+        # which only changes on T_o2jam_charinfo, and new player codes.
+        self._watermark = None
+        self._play_watermark = None
+        self._last_player_code = 0
+
+    def rank(self, option, player_code):
+        # Returns (RANK() OVER (ORDER BY value DESC), players sharing the value),
+        # or (0, 0) for players missing from the category.
+        option = PlayerRankingOption(option)
+        position = _INDEXED_OPTIONS.index(option)
+
+        with self._lock:
+            player_values = self._player_values.get(int(player_code))
+
+            if player_values is None or player_values[position] is None:
+                return 0, 0
+
+            value = player_values[position]
+            values = self._values[option]
+            lower = bisect_left(values, value)
+            upper = bisect_right(values, value)
+
+            return len(values) - upper + 1, upper - lower
+
+    def player_count(self, option):
+        with self._lock:
+            return len(self._values[PlayerRankingOption(option)])
+
+    def _rebuild(self, connection):
+        with connection.cursor() as cursor:
+            # The play watermark is read first so plays landing during the
+            # load are picked up by the next refresh.
+            cursor.execute(
+                f"""
+                SET NOCOUNT ON;
+
+                SELECT MAX(PlayedTime) FROM dbo.O2JamPlaylog;
+
+                SELECT
+                    {_PLAYER_VALUES_COLUMNS}
+                FROM
+                    dbo.O2JamStatus s
+                    FULL OUTER JOIN dbo.T_o2jam_charinfo c ON c.USER_INDEX_ID = s.PlayerCode
+            """
+            )
+
+            play_watermark = cursor.fetchval()
+            cursor.nextset()
+            raw_rows = cursor.fetchall()
+
+        player_values = {}
+        columns = [[] for _ in _INDEXED_OPTIONS]
+        watermark = None
+
+        for row in raw_rows:
+            values = tuple(row[1:10])
+            player_values[row[0]] = values
+
+            for column, value in zip(columns, values):
+                if value is not None:
+                    column.append(value)
+
+            if row[10] is not None and (watermark is None or row[10] > watermark):
+                watermark = row[10]
+
+        sorted_values = {
+            option: array("q", sorted(column))
+            for option, column in zip(_INDEXED_OPTIONS, columns)
+        }
+
+        with self._lock:
+            if player_values != self._player_values:
+                self.generation += 1
+
+            self._values = sorted_values
+            self._player_values = player_values
+            # An empty table still gets a watermark to refresh from.
+            self._watermark = watermark or _NO_WATERMARK
+            self._play_watermark = play_watermark or _NO_WATERMARK
+            self._last_player_code = max(player_values, default=0)
+            self._built_at = self._refreshed_at = time.monotonic()
+
+    def _apply_updates(self, connection):
+        with connection.cursor() as cursor:
+            # Players whose status changed, who played or who are new since
+            # the last refresh. Rows stamped exactly at a watermark are read
+            # again; applying an update twice leaves the index unchanged.
+            cursor.execute(
+                f"""
+                SET NOCOUNT ON;
+
+                DECLARE @StatusSince DATETIME = ?;
+                DECLARE @PlaySince DATETIME = ?;
+                DECLARE @LastPlayerCode INT = ?;
+
+                SELECT MAX(PlayedTime) FROM dbo.O2JamPlaylog WHERE PlayedTime >= @PlaySince;
+
+                SELECT PlayerCode INTO #touched
+                FROM dbo.O2JamStatus
+                WHERE UpdatedTime >= @StatusSince
+                UNION
+                SELECT PlayerCode FROM dbo.O2JamPlaylog WHERE PlayedTime >= @PlaySince
+                UNION
+                SELECT USER_INDEX_ID FROM dbo.T_o2jam_charinfo WHERE USER_INDEX_ID > @LastPlayerCode;
+
+                SELECT
+                    {_PLAYER_VALUES_COLUMNS}
+                FROM
+                    #touched t
+                    LEFT OUTER JOIN dbo.O2JamStatus s ON s.PlayerCode = t.PlayerCode
+                    LEFT OUTER JOIN dbo.T_o2jam_charinfo c ON c.USER_INDEX_ID = t.PlayerCode
+                WHERE
+                    s.PlayerCode IS NOT NULL OR c.USER_INDEX_ID IS NOT NULL;
+
+                DROP TABLE #touched;
+            """,
+                (self._watermark, self._play_watermark, self._last_player_code),
+            )
+
+            play_watermark = cursor.fetchval()
+            cursor.nextset()
+            raw_rows = cursor.fetchall()
+
+        with self._lock:
+            for row in raw_rows:
+                if self._replace_player(row[0], tuple(row[1:10])):
+                    self.generation += 1
+
+                if row[10] is not None and row[10] > self._watermark:
+                    self._watermark = row[10]
+
+                if row[0] > self._last_player_code:
+                    self._last_player_code = row[0]
+
+            if play_watermark is not None:
+                self._play_watermark = play_watermark
+
+            self._refreshed_at = time.monotonic()
+
+    def _replace_player(self, player_code, new_values):
+        # Returns whether the player's values changed.
+        old_values = self._player_values.get(player_code)
+
+        if old_values == new_values:
+            return False
+
+        for position, option in enumerate(_INDEXED_OPTIONS):
+            values = self._values[option]
+            old_value = old_values[position] if old_values is not None else None
+            new_value = new_values[position]
+
+            if old_value == new_value:
+                continue
+
+            if old_value is not None:
+                del values[bisect_left(values, old_value)]
+
+            if new_value is not None:
+                values.insert(bisect_left(values, new_value), new_value)
+
+        self._player_values[player_code] = new_values
+
+        return True
+
+
+class SongRankIndex(_RefreshingIndex):
+    """Sorted highscores of every chart, replacing RANK() over O2JamHighscore."""
+
+    def __init__(self, rebuild_interval=1800.0, refresh_interval=30.0):
+        super().__init__(rebuild_interval, refresh_interval)
+
+        self._scores = {}
+        self._watermark = None
+
+    def rank(self, music_code, difficulty, score):
+        # Same as RANK() OVER (PARTITION BY MusicCode, Difficulty ORDER BY Score DESC)
+        # for a highscore of the given chart.
+        with self._lock:
+            scores = self._scores.get((int(music_code), int(difficulty)))
+
+            if scores is None:
+                return 1
+
+            return len(scores) - bisect_right(scores, score) + 1
+
+    def _rebuild(self, connection):
+        with connection.cursor() as cursor:
+            # The watermark is read first so scores landing during the load
+            # are picked up by the next refresh.
+            cursor.execute(
+                """
+                SET NOCOUNT ON;
+
+                SELECT MAX(PlayedTime) FROM dbo.O2JamHighscore;
+
+                SELECT MusicCode, Difficulty, Score FROM dbo.O2JamHighscore;
+            """
+            )
+
+            watermark = cursor.fetchval()
+            cursor.nextset()
+            scores = self._group_scores(cursor.fetchall())
+
+        with self._lock:
+            if scores != self._scores:
+                self.generation += 1
+
+            self._scores = scores
+            self._watermark = watermark
+            self._built_at = self._refreshed_at = time.monotonic()
+
+    def _apply_updates(self, connection):
+        if self._watermark is None:
+            self._rebuild(connection)
+            return
+
+        with connection.cursor() as cursor:
+            # Only charts with a highscore set since the last refresh are
+            # reloaded, each one as a whole.
+            cursor.execute(
+                """
+                SET NOCOUNT ON;
+
+                DECLARE @Since DATETIME = ?;
+
+                SELECT MAX(PlayedTime) FROM dbo.O2JamHighscore;
+
+                SELECT
+                    h.MusicCode,
+                    h.Difficulty,
+                    h.Score
+                FROM
+                    dbo.O2JamHighscore h
+                    INNER JOIN (
+                        SELECT DISTINCT
+                            MusicCode,
+                            Difficulty
+                        FROM
+                            dbo.O2JamHighscore
+                        WHERE
+                            PlayedTime >= @Since
+                    ) touched ON touched.MusicCode = h.MusicCode AND touched.Difficulty = h.Difficulty;
+            """,
+                self._watermark,
+            )
+
+            watermark = cursor.fetchval()
+            cursor.nextset()
+            scores = self._group_scores(cursor.fetchall())
+
+        with self._lock:
+            if any(
+                self._scores.get(chart) != chart_scores
+                for chart, chart_scores in scores.items()
+            ):
+                self.generation += 1
+
+            self._scores.update(scores)
+            self._watermark = watermark
+            self._refreshed_at = time.monotonic()
+
+    @staticmethod
+    def _group_scores(raw_rows):
+        grouped = {}
+
+        for music_code, difficulty, score in raw_rows:
+            grouped.setdefault((music_code, difficulty), []).append(score)
+
+        return {chart: array("q", sorted(scores)) for chart, scores in grouped.items()}
+
+
+class _RankingSnapshotData:
+    __slots__ = (
+        "player_codes",
+        "nicknames",
+        "tiers",
+        "values",
+        "orders",
+        "ranks",
+        "rows",
+        "positions",
+    )
+
+    def __init__(
+        self, player_codes, nicknames, tiers, values, orders, ranks, positions=None
+    ):
+        self.player_codes = player_codes
+        self.nicknames = nicknames
+        self.tiers = tiers
+        # values[option][row] is -1 where the column is NULL.
+        self.values = values
+        # orders[option][position] is the row at that position of the ranking,
+        # ranks[option][position] its RANK() including every tiebreaker.
+        self.orders = orders
+        self.ranks = ranks
+        self.rows = {player_code: row for row, player_code in enumerate(player_codes)}
+
+        # positions[option][row] is the row's position in orders[option], -1
+        # where the row is not ranked.
+        if positions is not None:
+            self.positions = positions
+            return
+
+        self.positions = {}
+
+        for option, order in orders.items():
+            option_positions = array("l", [-1]) * len(player_codes)
+
+            for position, row in enumerate(order):
+                option_positions[row] = position
+
+            self.positions[option] = option_positions
+
+    def to_snapshot(self):
+        # (objects, arrays) for SnapshotStore.publish
+        arrays = {"player_codes": self.player_codes}
+
+        for option in self.orders:
+            arrays[f"values_{option.value}"] = self.values[option]
+            arrays[f"orders_{option.value}"] = self.orders[option]
+            arrays[f"ranks_{option.value}"] = self.ranks[option]
+            arrays[f"positions_{option.value}"] = self.positions[option]
+
+        return {"nicknames": self.nicknames, "tiers": self.tiers}, arrays
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        # The arrays stay memoryviews over the mapped file.
+        arrays = snapshot.arrays
+        options = [
+            option
+            for option in _INDEXED_OPTIONS
+            if f"orders_{option.value}" in arrays
+        ]
+
+        return cls(
+            arrays["player_codes"],
+            snapshot.objects["nicknames"],
+            snapshot.objects["tiers"],
+            {option: arrays[f"values_{option.value}"] for option in options},
+            {option: arrays[f"orders_{option.value}"] for option in options},
+            {option: arrays[f"ranks_{option.value}"] for option in options},
+            {option: arrays[f"positions_{option.value}"] for option in options},
+        )
+
+    def same_content(self, other):
+        return (
+            self.player_codes == other.player_codes
+            and self.nicknames == other.nicknames
+            and self.tiers == other.tiers
+            and self.values == other.values
+            and self.orders == other.orders
+            and self.ranks == other.ranks
+        )
+
+
+class PlayerRankingSnapshot(_RefreshingIndex):
+    """Every player ranking category computed in one pass and kept as arrays.
+
+    With a snapshot directory configured, a process that computed the
+    rankings publishes them and the others map that file while it is
+    fresh instead of querying O2JamStatus themselves. The arrays are
+    shared pages of the mapped file; nicknames and tier names are
+    decoded into every process."""
+
+    def __init__(self, rebuild_interval=60.0):
+        super().__init__(rebuild_interval, rebuild_interval, jitter=0.25)
+
+        self._data = _RankingSnapshotData(array("q"), [], [], {}, {}, {})
+
+    def count(self, option):
+        return len(self._data.orders.get(PlayerRankingOption(option), ()))
+
+    def position(self, option, player_code):
+        data = self._data
+        row = data.rows.get(int(player_code))
+
+        if row is None:
+            return None
+
+        option_positions = data.positions.get(PlayerRankingOption(option))
+
+        if option_positions is None or option_positions[row] == -1:
+            return None
+
+        return option_positions[row]
+
+    def standing(self, option, player_code):
+        # Returns (rank, tier) of the player, rank is None when unranked.
+        data = self._data
+        row = data.rows.get(int(player_code))
+
+        if row is None:
+            return None, None
+
+        option = PlayerRankingOption(option)
+        option_positions = data.positions.get(option)
+
+        if option_positions is None or option_positions[row] == -1:
+            return None, data.tiers[row]
+
+        return data.ranks[option][option_positions[row]], data.tiers[row]
+
+    def page(self, option, offset=0, limit=None):
+        option = PlayerRankingOption(option)
+        data = self._data
+        order = data.orders.get(option, array("l"))
+        end = len(order) if limit is None else offset + limit
+
+        return [
+            RankingEntry(
+                data.player_codes[row],
+                data.nicknames[row],
+                data.values[option][row] if data.values[option][row] != -1 else None,
+                data.tiers[row],
+                data.ranks[option][position],
+            )
+            for position, row in enumerate(order[offset:end], start=offset)
+        ]
+
+    def _rebuild(self, connection):
+        snapshot = snapshot_store.load("player_ranking", self._rebuild_interval)
+
+        if snapshot is not None:
+            self._swap(
+                _RankingSnapshotData.from_snapshot(snapshot),
+                time.time() - snapshot.published_at,
+            )
+            return
+
+        # Tier names come from the catalog instead of a join on TierInfo.
+        reference_catalog.ensure_fresh(connection)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT
+                    COALESCE(s.PlayerCode, c.USER_INDEX_ID),
+                    c.USER_NICKNAME,
+                    s.Tier,
+                    s.PlayerCode,
+                    c.USER_INDEX_ID,
+                    s.P,
+                    s.SS,
+                    s.S,
+                    s.A,
+                    s.B,
+                    s.C,
+                    s.D,
+                    s.Clear,
+                    c.Battle,
+                    s.UpdatedTime
+                FROM
+                    dbo.O2JamStatus s
+                    FULL OUTER JOIN dbo.T_o2jam_charinfo c ON c.USER_INDEX_ID = s.PlayerCode
+            """
+            )
+
+            raw_rows = cursor.fetchall()
+
+        values = {
+            option: array(
+                "q",
+                (
+                    raw_row[5 + column] if raw_row[5 + column] is not None else -1
+                    for raw_row in raw_rows
+                ),
+            )
+            for column, option in enumerate(_INDEXED_OPTIONS)
+        }
+        updated_times = [
+            raw_row[14] if raw_row[14] is not None else datetime.datetime.min
+            for raw_row in raw_rows
+        ]
+        status_rows = [
+            row for row, raw_row in enumerate(raw_rows) if raw_row[3] is not None
+        ]
+        charinfo_rows = [
+            row for row, raw_row in enumerate(raw_rows) if raw_row[4] is not None
+        ]
+
+        sort_keys = {}
+
+        for option in _INDEXED_OPTIONS:
+            option_values = values[option]
+
+            if option == PlayerRankingOption.ORDER_PLAYCOUNT:
+                sort_keys[option] = (
+                    charinfo_rows,
+                    lambda row, option_values=option_values: option_values[row],
+                )
+            elif option == PlayerRankingOption.ORDER_CLEAR:
+                # Clear ties are broken by the lower grades first.
+                tiebreakers = [
+                    values[PlayerRankingOption(code)]
+                    for code in (7, 6, 5, 4, 3, 2, 1, 0)
+                ]
+                sort_keys[option] = (
+                    status_rows,
+                    lambda row, tiebreakers=tiebreakers: (
+                        *(column[row] for column in tiebreakers),
+                        updated_times[row],
+                    ),
+                )
+            else:
+                sort_keys[option] = (
+                    status_rows,
+                    lambda row, option_values=option_values: (
+                        option_values[row],
+                        updated_times[row],
+                    ),
+                )
+
+        orders = {}
+        ranks = {}
+
+        for option, (members, sort_key) in sort_keys.items():
+            order = sorted(members, key=sort_key, reverse=True)
+            option_ranks = array("l")
+            previous_key = None
+            rank = 0
+
+            for position, row in enumerate(order):
+                key = sort_key(row)
+
+                if key != previous_key:
+                    rank = position + 1
+                    previous_key = key
+
+                option_ranks.append(rank)
+
+            orders[option] = array("l", order)
+            ranks[option] = option_ranks
+
+        data = _RankingSnapshotData(
+            array("q", (raw_row[0] for raw_row in raw_rows)),
+            [raw_row[1] for raw_row in raw_rows],
+            [reference_catalog.tier_name(raw_row[2]) for raw_row in raw_rows],
+            values,
+            orders,
+            ranks,
+        )
+
+        self._swap(data, 0.0)
+        snapshot_store.publish("player_ranking", *data.to_snapshot())
+
+    def _swap(self, data, age):
+        # age : seconds since the data was read, so a published snapshot is
+        # refreshed when it gets stale rather than a full interval after
+        # this process mapped it.
+        with self._lock:
+            if not data.same_content(self._data):
+                self.generation += 1
+
+            self._data = data
+            self._built_at = self._refreshed_at = time.monotonic() - age
+
+    def _apply_updates(self, connection):
+        self._rebuild(connection)
+
+
+player_ranking_index = PlayerRankingIndex()
+song_rank_index = SongRankIndex()
+player_ranking_snapshot = PlayerRankingSnapshot()
@@ -0,0 +1,301 @@
+import dataclasses
+import datetime
+from operator import attrgetter, itemgetter
+
+FETCH_CHUNK_SIZE = 500
+
+
+class Record:
+    """Base of the slotted record types the managers return.
+
+    Records can be read like dicts (record["score"]), which keeps templates
+    working, and only become dicts when they are serialized."""
+
+    __slots__ = ()
+
+    FIELDS = ()
+
+    # Field values in FIELDS order, an attrgetter set by record_type.
+    _values = staticmethod(lambda record: ())
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def to_row(self):
+        return self._values(self)
+
+    def to_dict(self):
+        return dict(zip(self.FIELDS, self._values(self)))
+
+
+def record_type(cls):
+    # Declares a Record subclass from its annotated fields.
+    cls = dataclasses.dataclass(slots=True)(cls)
+    cls.FIELDS = tuple(field.name for field in dataclasses.fields(cls))
+    cls._values = attrgetter(*cls.FIELDS)
+
+    return cls
+
+
+class Computed:
+    """Field source computed from the whole row and the mapping context."""
+
+    __slots__ = ("function",)
+
+    def __init__(self, function):
+        # function : callable taking (row, context)
+        self.function = function
+
+
+def optional_float(index):
+    def convert(row, context):
+        value = row[index]
+        return float(value) if value is not None else None
+
+    return Computed(convert)
+
+
+def row_number(index):
+    # Row numbers of a page that does not start at the top of the query.
+    return Computed(lambda row, context: row[index] + context.get("row_offset", 0))
+
+
+def _tuple_getter(indexes):
+    # itemgetter that returns a tuple for any number of indexes.
+    if len(indexes) == 1:
+        index = indexes[0]
+
+        return lambda values: (values[index],)
+
+    if not indexes:
+        return lambda values: ()
+
+    return itemgetter(*indexes)
+
+
+class RowMapper:
+    """Builds records from cursor rows, declared field by field.
+
+    Each field is given either the index of the cursor column it is copied
+    from or a Computed source, e.g.
+    RowMapper(ChartSearchEntry, music_code=0, ..., bpm=Computed(...))"""
+
+    def __init__(self, record_class, **sources):
+        if tuple(sources) != record_class.FIELDS:
+            raise ValueError(
+                f"{record_class.__name__} fields must be mapped in declaration order"
+            )
+
+        self._record_class = record_class
+        # Copied columns are read with one itemgetter, computed values are
+        # then inserted at their field positions, in ascending order.
+        self._columns = _tuple_getter(
+            [
+                int(source)
+                for source in sources.values()
+                if not isinstance(source, Computed)
+            ]
+        )
+        self._computed = tuple(
+            (position, source.function)
+            for position, source in enumerate(sources.values())
+            if isinstance(source, Computed)
+        )
+
+    def map_row(self, row, **context):
+        return self.map_rows((row,), **context)[0]
+
+    def map_rows(self, rows, **context):
+        record_class = self._record_class
+        columns = self._columns
+        computed = self._computed
+        records = []
+
+        for row in rows:
+            values = list(columns(row))
+
+            for position, compute in computed:
+                values.insert(position, compute(row, context))
+
+            records.append(record_class(*values))
+
+        return records
+
+    def iter_records(self, cursor, **context):
+        # Maps the result set one fetchmany batch at a time.
+        while True:
+            rows = cursor.fetchmany(FETCH_CHUNK_SIZE)
+
+            if not rows:
+                return
+
+            yield from self.map_rows(rows, **context)
+
+
+def encode_default(value):
+    # json.dumps default hook, anything other than a record is sent as text.
+    if isinstance(value, Record):
+        return value.to_dict()
+
+    if isinstance(value, datetime.date):
+        # Sortable ISO 8601 timestamps.
+        return value.isoformat()
+
+    return str(value)
+
+
+@record_type
+class ScoreRecord(Record):
+    player_code: int
+    music_code: int
+    music_title: str
+    music_difficulty: int
+    music_level: int
+    score: int
+    score_cool: int
+    score_good: int
+    score_bad: int
+    score_miss: int
+    score_max_combo: int
+    progress: str
+    is_cleared_record: bool
+    cleared_time: datetime.datetime
+    record_rank: int
+    pattern_order: int
+    play_speed_rate: float
+    play_timing_rate: int
+    fln_option: int
+    sln_option: int
+    is_nln: bool
+    row_number: int
+
+
+@record_type
+class RecentRecord(Record):
+    music_code: int
+    music_title: str
+    cleared_time: datetime.datetime
+    score: int
+    progress: int
+    is_cleared_record: bool
+    score_cool: int
+    score_good: int
+    score_bad: int
+    score_miss: int
+    score_max_combo: int
+    pattern_order: int
+    play_speed_rate: float
+    play_timing_rate: int
+    fln_option: int
+    sln_option: int
+    is_nln: bool
+    music_level: int
+    row_number: int
+
+
+@record_type
+class HistoryRecord(Record):
+    player_code: int
+    cleared_time: datetime.datetime
+    score: int
+    progress: int
+    is_cleared_record: bool
+    score_cool: int
+    score_good: int
+    score_bad: int
+    score_miss: int
+    score_max_combo: int
+    pattern_order: int
+    play_speed_rate: float
+    play_timing_rate: int
+    fln_option: int
+    sln_option: int
+    is_nln: bool
+    row_number: int
+
+
+@record_type
+class ChartRecord(Record):
+    player_code: int
+    player_nickname: str
+    score_cool: int
+    score_good: int
+    score_bad: int
+    score_miss: int
+    score_max_combo: int
+    score: int
+    is_cleared_record: bool
+    cleared_time: datetime.datetime
+    progress: str
+    pattern_order: int
+    play_speed_rate: float
+    play_timing_rate: int
+    fln_option: int
+    sln_option: int
+    is_nln: bool
+    row_number: int
+
+
+@record_type
+class ChartSearchEntry(Record):
+    music_code: int
+    title: str
+    artist: str
+    note_charter: str
+    bpm: float
+    hard_level: int
+
+
+@record_type
+class ChartSuggestion(Record):
+    text: str
+    field: str
+    chart_count: int
+
+
+@record_type
+class PlayerSearchEntry(Record):
+    player_code: int
+    player_nickname: str
+    former_nickname: str
+    tier: str
+    rank: int
+    row_number: int
+
+
+@record_type
+class RankingEntry(Record):
+    player_code: int
+    player_nickname: str
+    rank: int
+    tier: str
+    row_number: int
+
+
+@record_type
+class TierInfo(Record):
+    p_rank: int
+    ss_rank: int
+    s_rank: int
+    a_rank: int
+    b_rank: int
+    c_rank: int
+    d_rank: int
+    cleared: int
+    tier: str
+
+
+@record_type
+class MusicInfo(Record):
+    music_code: int
+    title: str
+    artist: str
+    note_charter: str
+    bpm: int
+    difficulty: int
+    level: int
+    note_count: int
+    play_count: int
@@ -0,0 +1,264 @@
+import time
+
+from src.database.records import ChartSearchEntry, Computed, MusicInfo
+from src.database.refreshing_index import _RefreshingIndex
+from src.database.snapshot_store import snapshot_store
+
+# Checksums of every cached column except the play counts, which change with
+# every play and are reloaded on each refresh instead.
+_CATALOG_CHECKSUM_QUERY = """
+                SELECT
+                    (
+                        SELECT CHECKSUM_AGG(BINARY_CHECKSUM(MusicCode, Title, Artist, NoteCharter, BPM))
+                        FROM dbo.o2jam_music_metadata
+                    ),
+                    (
+                        SELECT CHECKSUM_AGG(BINARY_CHECKSUM(MusicCode, Difficulty, NoteLevel, NoteCount))
+                        FROM dbo.o2jam_music_data
+                    ),
+                    (SELECT CHECKSUM_AGG(BINARY_CHECKSUM(*)) FROM dbo.ProgressInfo),
+                    (SELECT CHECKSUM_AGG(BINARY_CHECKSUM(*)) FROM dbo.TierInfo),
+                    (SELECT CHECKSUM_AGG(BINARY_CHECKSUM(*)) FROM dbo.nickname_exchange_info),
+                    (SELECT COUNT(*) FROM dbo.o2jam_music_metadata),
+                    (SELECT COUNT(*) FROM dbo.o2jam_music_data);
+"""
+
+
+def catalog_title(music_code_index):
+    # RowMapper source of the title of the chart in a row.
+    return Computed(lambda row, context: reference_catalog.title(row[music_code_index]))
+
+
+def catalog_level(music_code_index):
+    # Level at the difficulty given in the mapping context.
+    return Computed(
+        lambda row, context: reference_catalog.level(
+            row[music_code_index], context["difficulty"]
+        )
+    )
+
+
+def catalog_progress_name(progress_index):
+    return Computed(
+        lambda row, context: reference_catalog.progress_name(row[progress_index])
+    )
+
+
+class _CatalogData:
+    __slots__ = ("music", "charts", "progress_names", "tier_names", "exchange_money")
+
+    def __init__(self, music, charts, progress_names, tier_names, exchange_money):
+        # {music_code: (title, artist, note_charter, bpm)}
+        self.music = music
+        # {(music_code, difficulty): (note_level, note_count)}
+        self.charts = charts
+        self.progress_names = progress_names
+        self.tier_names = tier_names
+        # {nickname_count: exchange_money}
+        self.exchange_money = exchange_money
+
+
+class ReferenceCatalog(_RefreshingIndex):
+    """The small, rarely changing tables other queries only join for names:
+    o2jam_music_metadata, o2jam_music_data, ProgressInfo, TierInfo and
+    nickname_exchange_info.
+
+    Queries select the codes and the names are filled in from here, e.g.
+    reference_catalog.progress_name(row[11]). Like PlayerRankingSnapshot,
+    other processes load it from the snapshot directory instead of
+    querying, but each one decodes its own copy; only the queries are
+    saved, not the memory."""
+
+    def __init__(self, rebuild_interval=3600.0, refresh_interval=60.0):
+        super().__init__(rebuild_interval, refresh_interval, jitter=0.25)
+
+        self._data = _CatalogData({}, {}, {}, {}, {})
+        # {(music_code, difficulty): play_count}
+        self._play_counts = {}
+        self._checksum = None
+
+    def title(self, music_code):
+        music = self._data.music.get(music_code)
+
+        return music[0] if music is not None else None
+
+    def level(self, music_code, difficulty):
+        chart = self._data.charts.get((music_code, difficulty))
+
+        return chart[0] if chart is not None else None
+
+    def progress_name(self, progress_index):
+        return self._data.progress_names.get(progress_index)
+
+    def tier_name(self, tier_index):
+        return self._data.tier_names.get(tier_index)
+
+    def exchange_money(self, nickname_count):
+        return self._data.exchange_money.get(nickname_count)
+
+    def music_info(self, music_code, difficulty):
+        # Same as o2jam_music_metadata LEFT OUTER JOIN o2jam_music_data.
+        music_code = int(music_code)
+        difficulty = int(difficulty)
+        music = self._data.music.get(music_code)
+
+        if music is None:
+            return None
+
+        title, artist, note_charter, bpm = music
+        note_level, note_count = self._data.charts.get(
+            (music_code, difficulty), (None, None)
+        )
+
+        return MusicInfo(
+            music_code,
+            title,
+            artist,
+            note_charter,
+            round(float(bpm)),
+            difficulty,
+            note_level,
+            note_count,
+            self._play_counts.get((music_code, difficulty)),
+        )
+
+    def chart_entries(self):
+        # Charts with a Hard level, ordered by level and then newest first.
+        data = self._data
+        entries = []
+
+        for music_code, (title, artist, note_charter, bpm) in data.music.items():
+            note_level = data.charts.get((music_code, 2), (None,))[0]
+
+            if note_level is not None:
+                entries.append(
+                    ChartSearchEntry(
+                        music_code,
+                        title,
+                        artist,
+                        note_charter,
+                        round(float(bpm), 2),
+                        note_level,
+                    )
+                )
+
+        entries.sort(key=lambda entry: (entry.hard_level, -entry.music_code))
+
+        return entries
+
+    def _rebuild(self, connection, checksum=None):
+        # checksum : current checksum when it is known to have changed, a
+        #            published snapshot is only used when it matches
+        snapshot = snapshot_store.load("reference_catalog", self._rebuild_interval)
+
+        if snapshot is not None and (
+            checksum is None or tuple(snapshot.objects["checksum"]) == checksum
+        ):
+            objects = snapshot.objects
+            self._swap(
+                _CatalogData(
+                    objects["music"],
+                    objects["charts"],
+                    objects["progress_names"],
+                    objects["tier_names"],
+                    objects["exchange_money"],
+                ),
+                objects["play_counts"],
+                tuple(objects["checksum"]),
+                time.time() - snapshot.published_at,
+            )
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SET NOCOUNT ON;
+
+                {_CATALOG_CHECKSUM_QUERY}
+
+                SELECT MusicCode, Title, Artist, NoteCharter, BPM
+                FROM dbo.o2jam_music_metadata;
+
+                SELECT MusicCode, Difficulty, NoteLevel, NoteCount, PlayCount
+                FROM dbo.o2jam_music_data;
+
+                SELECT progress_index, progress_name FROM dbo.ProgressInfo;
+
+                SELECT tier_index, tier_name FROM dbo.TierInfo;
+
+                SELECT nickname_count, exchange_money FROM dbo.nickname_exchange_info;
+            """
+            )
+
+            checksum = tuple(cursor.fetchone())
+            cursor.nextset()
+            music = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+            cursor.nextset()
+            chart_rows = cursor.fetchall()
+            cursor.nextset()
+            progress_names = dict(cursor.fetchall())
+            cursor.nextset()
+            tier_names = dict(cursor.fetchall())
+            cursor.nextset()
+            exchange_money = dict(cursor.fetchall())
+
+        data = _CatalogData(
+            music,
+            {(row[0], row[1]): (row[2], row[3]) for row in chart_rows},
+            progress_names,
+            tier_names,
+            exchange_money,
+        )
+        play_counts = {(row[0], row[1]): row[4] for row in chart_rows}
+
+        self._swap(data, play_counts, checksum, 0.0)
+        snapshot_store.publish(
+            "reference_catalog",
+            {
+                "music": data.music,
+                "charts": data.charts,
+                "progress_names": data.progress_names,
+                "tier_names": data.tier_names,
+                "exchange_money": data.exchange_money,
+                "play_counts": play_counts,
+                "checksum": checksum,
+            },
+            {},
+        )
+
+    def _swap(self, data, play_counts, checksum, age):
+        # age : seconds since the data was read, see PlayerRankingSnapshot
+        with self._lock:
+            if checksum != self._checksum:
+                self.generation += 1
+
+            self._data = data
+            self._play_counts = play_counts
+            self._checksum = checksum
+            self._built_at = self._refreshed_at = time.monotonic() - age
+
+    def _apply_updates(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SET NOCOUNT ON;
+
+                {_CATALOG_CHECKSUM_QUERY}
+
+                SELECT MusicCode, Difficulty, PlayCount FROM dbo.o2jam_music_data;
+            """
+            )
+
+            checksum = tuple(cursor.fetchone())
+            cursor.nextset()
+            play_counts = {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+
+        if checksum != self._checksum:
+            self._rebuild(connection, checksum)
+            return
+
+        self._play_counts = play_counts
+        self._refreshed_at = time.monotonic()
+
+
+reference_catalog = ReferenceCatalog()
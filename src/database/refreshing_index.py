@@ -0,0 +1,65 @@
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+
+
+class _RefreshingIndex(ABC):
+    """Rebuilds from the database periodically and applies deltas in between."""
+
+    def __init__(self, rebuild_interval, refresh_interval, jitter=0.0):
+        # jitter : fraction of the intervals randomly added after each load, so
+        #          processes sharing a snapshot file don't all expire at once;
+        #          the first one to expire publishes and the rest load its file
+        self._rebuild_interval = rebuild_interval
+        self._refresh_interval = refresh_interval
+        self._jitter = jitter
+        self._stretch = 1.0
+
+        # Guards the indexed data; held only while reading or swapping it.
+        self._lock = threading.Lock()
+        # Serializes database loads so only one thread refreshes at a time.
+        self._refresh_lock = threading.Lock()
+
+        self._built_at = None
+        self._refreshed_at = None
+
+        # Bumped whenever the indexed data actually changes, so it can be
+        # used as a version marker of everything derived from it.
+        self.generation = 0
+
+    def ensure_fresh(self, connection):
+        now = time.monotonic()
+
+        if self._built_at is None:
+            # Nothing to answer from yet, so every caller waits for the build.
+            with self._refresh_lock:
+                if self._built_at is None:
+                    self._rebuild(connection)
+                    self._stretch = 1.0 + random.uniform(0.0, self._jitter)
+            return
+
+        if now - self._built_at > self._rebuild_interval * self._stretch:
+            refresh = self._rebuild
+        elif now - self._refreshed_at > self._refresh_interval * self._stretch:
+            refresh = self._apply_updates
+        else:
+            return
+
+        # Whoever loses the race keeps answering from the current data.
+        if self._refresh_lock.acquire(blocking=False):
+            try:
+                refresh(connection)
+                self._stretch = 1.0 + random.uniform(0.0, self._jitter)
+            finally:
+                self._refresh_lock.release()
+
+    @abstractmethod
+    def _rebuild(self, connection):
+        # Loads everything from the database and swaps it in.
+        pass
+
+    @abstractmethod
+    def _apply_updates(self, connection):
+        # Loads what changed since the last load.
+        pass
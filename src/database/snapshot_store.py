@@ -0,0 +1,225 @@
+import marshal
+import mmap
+import os
+import struct
+import time
+from array import array
+from decimal import Decimal
+
+from src.config import SNAPSHOT_CONFIG
+
+_MAGIC = b"OXYSNAP\0"
+_FORMAT_VERSION = 1
+
+# magic, format version, published_at (time.time()), section count
+_HEADER = struct.Struct("<8sIdI")
+# section name, offset, length
+_SECTION = struct.Struct("<16sQQ")
+
+_OBJECTS_SECTION = "objects"
+
+# Versions of a snapshot kept on disk, older ones may still be mapped by
+# processes that loaded them.
+_KEPT_VERSIONS = 3
+
+
+class Snapshot:
+    """A published snapshot mapped read-only.
+
+    arrays are memoryviews of int64 straight over the mapping, so every
+    process mapping the same file shares their pages. objects holds the
+    rest, decoded into this process."""
+
+    __slots__ = ("published_at", "objects", "arrays", "_mapping")
+
+    def __init__(self, published_at, objects, arrays, mapping):
+        self.published_at = published_at
+        self.objects = objects
+        self.arrays = arrays
+        # Kept so the mapping lives as long as the arrays over it.
+        self._mapping = mapping
+
+
+def _plain(value):
+    # marshal only takes builtin types; DECIMAL and MONEY columns become
+    # int or float like they compare in Python.
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+
+    if isinstance(value, tuple):
+        return tuple(_plain(item) for item in value)
+
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+
+    if isinstance(value, dict):
+        return {_plain(key): _plain(item) for key, item in value.items()}
+
+    return value
+
+
+class SnapshotStore:
+    """Versioned snapshot files of the in-memory indexes, shared between
+    processes.
+
+    Every publish writes a new version file, named after the time it was
+    published, and readers map the newest complete one. Nothing is ever
+    renamed over a file another process may have mapped, which Windows
+    refuses while the mapping is open. Old versions are removed once they
+    fall out of the newest few, or on a later publish if still mapped."""
+
+    def __init__(self, directory):
+        self._directory = directory
+
+    @property
+    def enabled(self):
+        return bool(self._directory)
+
+    def publish(self, name, objects, arrays):
+        # objects : builtin values stored with marshal
+        # arrays : {name: sequence of ints} stored as raw int64
+        if not self.enabled:
+            return None
+
+        published_at = time.time()
+        sections = [(_OBJECTS_SECTION, marshal.dumps(_plain(objects)))]
+        sections.extend(
+            (array_name, array("q", values).tobytes())
+            for array_name, values in arrays.items()
+        )
+
+        offset = _HEADER.size + _SECTION.size * len(sections)
+        directory = []
+        payload = []
+
+        for section_name, data in sections:
+            # int64 arrays are cast in place, so they start 8-byte aligned.
+            padding = -offset % 8
+            payload.append(b"\0" * padding)
+            offset += padding
+            directory.append(
+                _SECTION.pack(section_name.encode("ascii"), offset, len(data))
+            )
+            payload.append(data)
+            offset += len(data)
+
+        # The version sorts by publish time as text, the process id keeps
+        # two processes publishing at once apart.
+        path = self._path(name, f"{time.time_ns():020d}-{os.getpid()}")
+        temporary_path = f"{path}.tmp"
+
+        try:
+            with open(temporary_path, "wb") as file:
+                file.write(
+                    _HEADER.pack(_MAGIC, _FORMAT_VERSION, published_at, len(sections))
+                )
+                file.writelines(directory)
+                file.writelines(payload)
+                file.flush()
+                os.fsync(file.fileno())
+
+            os.replace(temporary_path, path)
+        except OSError:
+            # Other processes keep loading from the database, this one
+            # already has the data.
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+
+            return None
+
+        self._remove_old_versions(name)
+
+        return published_at
+
+    def load(self, name, max_age):
+        # Returns the snapshot published at most max_age seconds ago, or None.
+        if not self.enabled:
+            return None
+
+        versions = self._versions(name)
+
+        if not versions:
+            return None
+
+        try:
+            with open(versions[-1], "rb") as file:
+                mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        views = []
+
+        try:
+            magic, format_version, published_at, section_count = (
+                _HEADER.unpack_from(mapping)
+            )
+
+            if (
+                magic != _MAGIC
+                or format_version != _FORMAT_VERSION
+                or time.time() - published_at > max_age
+            ):
+                mapping.close()
+                return None
+
+            objects = None
+            arrays = {}
+
+            for index in range(section_count):
+                section_name, offset, length = _SECTION.unpack_from(
+                    mapping, _HEADER.size + _SECTION.size * index
+                )
+                section_name = section_name.rstrip(b"\0").decode("ascii")
+                data = memoryview(mapping)[offset : offset + length]
+                views.append(data)
+
+                if section_name == _OBJECTS_SECTION:
+                    objects = marshal.loads(data)
+                else:
+                    arrays[section_name] = data.cast("q")
+                    views.append(arrays[section_name])
+        except (struct.error, EOFError, TypeError, ValueError):
+            # Written by another format or damaged, it is republished by
+            # the next load from the database. The views over the mapping
+            # are released first, mmap refuses to close under them.
+            for view in reversed(views):
+                view.release()
+
+            mapping.close()
+            return None
+
+        return Snapshot(published_at, objects, arrays, mapping)
+
+    def _path(self, name, version):
+        return os.path.join(self._directory, f"{name}.{version}.snapshot")
+
+    def _versions(self, name):
+        # Paths of the published versions of name, oldest first.
+        try:
+            file_names = os.listdir(self._directory)
+        except OSError:
+            return []
+
+        prefix = f"{name}."
+        suffix = ".snapshot"
+
+        return [
+            os.path.join(self._directory, file_name)
+            for file_name in sorted(file_names)
+            if file_name.startswith(prefix)
+            and file_name.endswith(suffix)
+            and file_name[len(prefix) : -len(suffix)].partition("-")[0].isdigit()
+        ]
+
+    def _remove_old_versions(self, name):
+        for path in self._versions(name)[:-_KEPT_VERSIONS]:
+            try:
+                os.remove(path)
+            except OSError:
+                # Still mapped on Windows, removed by a later publish.
+                pass
+
+
+snapshot_store = SnapshotStore(SNAPSHOT_CONFIG["directory"])
@@ -0,0 +1,552 @@
+import hashlib
+import itertools
+import threading
+
+from src.tools.pagination import seek_condition
+
+
+class Statement:
+    """Named SQL whose text varies only between a fixed set of variants.
+
+    Every value is bound as a parameter, so each variant is one statement
+    text and one cached plan on the server, e.g.
+    PLAYER_TOP_RECORD_COUNT.sql(view="cleared")"""
+
+    def __init__(self, name, template, **variants):
+        # template : SQL with one {slot} per variant slot
+        # variants : {slot: {choice: SQL fragment}}
+        self.name = name
+        self._slots = tuple(variants)
+        self._texts = {
+            choices: template.format(
+                **{
+                    slot: variants[slot][choice]
+                    for slot, choice in zip(self._slots, choices)
+                }
+            )
+            for choices in itertools.product(*variants.values())
+        }
+
+    @property
+    def variant_count(self):
+        return len(self._texts)
+
+    def sql(self, **choices):
+        try:
+            return self._texts[tuple(choices[slot] for slot in self._slots)]
+        except KeyError:
+            raise ValueError(f"Unknown variant of {self.name}: {choices}") from None
+
+
+_statements = {}
+_executions = {}
+# {statement text: [requests running it more than once, extra executions]}
+_repetitions = {}
+_executions_lock = threading.Lock()
+
+
+def register(name, template, **variants):
+    statement = Statement(name, template, **variants)
+    _statements[name] = statement
+
+    return statement
+
+
+def record_execution(sql):
+    # Counts executions per distinct statement text.
+    with _executions_lock:
+        _executions[sql] = _executions.get(sql, 0) + 1
+
+
+def record_repetition(sql, extra_executions):
+    # A statement ran again with the same parameters within one request,
+    # only counted when DB_TRACK_REPEATED_STATEMENTS is on.
+    with _executions_lock:
+        counts = _repetitions.setdefault(sql, [0, 0])
+        counts[0] += 1
+        counts[1] += extra_executions
+
+
+def _fingerprint(sql):
+    # Identifies a statement text in the report without publishing it.
+    return "sql:" + hashlib.sha1(" ".join(sql.split()).encode()).hexdigest()[:12]
+
+
+def statement_report():
+    # Statement texts executed through ConnectionLease.execute since startup,
+    # grouped by the registered statement they belong to, and any statement
+    # a request ran more than once with the same parameters. Statements are
+    # named or fingerprinted, never returned as SQL.
+    with _executions_lock:
+        executions = dict(_executions)
+        repetitions = {sql: tuple(counts) for sql, counts in _repetitions.items()}
+
+    names = {
+        text: statement.name
+        for statement in _statements.values()
+        for text in statement._texts.values()
+    }
+    report = {
+        name: {
+            "declared_variants": statement.variant_count,
+            "seen_variants": 0,
+            "executions": 0,
+        }
+        for name, statement in _statements.items()
+    }
+    unregistered = []
+
+    for text, count in executions.items():
+        name = names.get(text)
+
+        if name is None:
+            unregistered.append({"statement": _fingerprint(text), "executions": count})
+            continue
+
+        report[name]["seen_variants"] += 1
+        report[name]["executions"] += count
+
+    return {
+        # The registry only covers the statements moved to this module, the
+        # inline SQL of the version manager, the indexes, utils and account
+        # runs on plain cursors and is missing from the execution counts.
+        "scope": {
+            "executions": "registered statements run through ConnectionLease.execute",
+            "repeated_in_request": "every statement of a request, inline SQL included",
+        },
+        "distinct_texts": len(executions),
+        "statements": report,
+        "unregistered": unregistered,
+        "repeated_in_request": [
+            {
+                "statement": names.get(sql) or _fingerprint(sql),
+                "requests": requests,
+                "extra_executions": extra_executions,
+            }
+            for sql, (requests, extra_executions) in sorted(
+                repetitions.items(), key=lambda item: -item[1][1]
+            )
+        ],
+    }
+
+
+_VIEW_OPTIONS = {"cleared": "h.isClear = 1", "f_rank": "h.Score >= 70000"}
+
+_TOP_RECORDS_SEEK = """
+                            AND (d.NoteLevel < ?
+                                 OR (d.NoteLevel = ? AND h.Score < ?)
+                                 OR (d.NoteLevel = ? AND h.Score = ? AND h.MusicCode > ?))"""
+
+PLAYER_TOP_RECORDS = register(
+    "player_top_records",
+    """
+                WITH RankedResults AS (
+                    SELECT
+                        h.PlayerCode,
+                        h.MusicCode,
+                        h.Difficulty,
+                        d.NoteLevel,
+                        h.Score,
+                        h.Cool,
+                        h.Good,
+                        h.Bad,
+                        h.Miss,
+                        h.MaxCombo,
+                        h.Progress,
+                        h.isClear,
+                        h.PlayedTime,
+                        h.PatternOrder,
+                        ROUND(h.PlaySpeedRate, 3) AS PlaySpeedRate,
+                        h.PlayTimingRate,
+                        h.FLNOption,
+                        h.SLNOption,
+                        h.isNLN,
+                        ROW_NUMBER() OVER (
+                            ORDER BY d.NoteLevel DESC, h.Score DESC, h.MusicCode
+                        ) AS RowNumber
+                    FROM dbo.O2JamHighscore h
+                    INNER JOIN dbo.o2jam_music_data d
+                        ON d.MusicCode = h.MusicCode
+                        AND d.Difficulty = h.Difficulty
+                    WHERE h.PlayerCode = ?
+                        AND h.Difficulty = ?
+                        AND {view}{seek}
+                )
+                SELECT
+                    PlayerCode,
+                    MusicCode,
+                    Difficulty,
+                    NoteLevel,
+                    Score,
+                    Cool,
+                    Good,
+                    Bad,
+                    Miss,
+                    MaxCombo,
+                    Progress,
+                    isClear,
+                    PlayedTime,
+                    PatternOrder,
+                    PlaySpeedRate,
+                    PlayTimingRate,
+                    FLNOption,
+                    SLNOption,
+                    isNLN,
+                    RowNumber
+                FROM RankedResults
+                {page}
+                ORDER BY RowNumber;
+            """,
+    view=_VIEW_OPTIONS,
+    seek={"none": "", "after": _TOP_RECORDS_SEEK},
+    # number : page number and page size, next : page size
+    page={
+        "all": "",
+        "number": "WHERE RowNumber BETWEEN ? * ? + 1 AND (? + 1) * ?",
+        "next": "WHERE RowNumber <= ?",
+    },
+)
+
+PLAYER_TOP_RECORD_COUNT = register(
+    "player_top_record_count",
+    """
+                    SELECT COUNT(h.PlayerCode)
+                    FROM dbo.O2JamHighscore h
+                    WHERE h.PlayerCode = ?
+                          AND h.Difficulty = ?
+                          AND {view}
+                """,
+    view=_VIEW_OPTIONS,
+)
+
+PLAYER_SCOREBOARD_RANGES = register(
+    "player_scoreboard_ranges",
+    """
+                    WITH RankedResults AS (
+                        SELECT
+                            d.NoteLevel,
+                            CEILING(CAST(ROW_NUMBER() OVER (ORDER BY d.NoteLevel DESC, h.Score DESC, h.MusicCode) AS FLOAT) / ?) AS page_num
+                        FROM dbo.O2JamHighscore h
+                        INNER JOIN dbo.o2jam_music_data d ON d.MusicCode = h.MusicCode AND d.Difficulty = h.Difficulty
+                        WHERE h.PlayerCode = ? AND h.Difficulty = ? AND {view}
+                    )
+                    SELECT page_num, MIN(NoteLevel) as min_level, MAX(NoteLevel) as max_level
+                    FROM RankedResults
+                    GROUP BY page_num
+                    ORDER BY page_num
+                """,
+    view=_VIEW_OPTIONS,
+)
+
+RECORD_HISTORIES = register(
+    "record_histories",
+    """
+                    SELECT TOP 50
+                        PlayedTime,
+                        Score,
+                        Progress,
+                        isClear,
+                        Cool,
+                        Good,
+                        Bad,
+                        Miss,
+                        MaxCombo,
+                        PatternOrder,
+                        ROUND(PlaySpeedRate, 3) AS PlaySpeedRate,
+                        PlayTimingRate,
+                        FLNOption,
+                        SLNOption,
+                        isNLN,
+                        RowNum
+                    FROM (
+                        SELECT *,
+                               ROW_NUMBER() OVER (
+                                   PARTITION BY isClear
+                                   ORDER BY
+                                       CASE
+                                           WHEN isClear = 1 THEN Score
+                                           ELSE Cool + Good + Bad + Miss
+                                       END DESC
+                               ) AS RowNum
+                        FROM dbo.O2JamPlaylog
+                        WHERE PlayerCode = ? AND MusicCode = ? AND Difficulty = ?
+                    ) RankedScores
+                    ORDER BY {order}
+                """,
+    order={"score": "Score DESC", "date": "PlayedTime DESC"},
+)
+
+RECENT_RECORDS = register(
+    "recent_records",
+    """
+                    SELECT TOP (?)
+                        p.MusicCode,
+                        PlayedTime,
+                        Score,
+                        Progress,
+                        isClear,
+                        Cool,
+                        Good,
+                        Bad,
+                        Miss,
+                        MaxCombo,
+                        PatternOrder,
+                        ROUND(PlaySpeedRate, 3) AS PlaySpeedRate,
+                        PlayTimingRate,
+                        FLNOption,
+                        SLNOption,
+                        isNLN,
+                        ROW_NUMBER() OVER (ORDER BY PlayedTime DESC, p.id DESC) RowNum,
+                        p.id
+                    FROM dbo.O2JamPlaylog AS p
+                    WHERE
+                        PlayerCode = ?
+                        AND p.Difficulty = ?
+                        AND PlayedTime > DATEADD(day, -15, GETDATE())
+                        {view}
+                        {seek}
+                    ORDER BY p.PlayedTime DESC, p.id DESC
+                """,
+    view={"cleared": "AND isClear = 1", "f_rank": ""},
+    seek={
+        "none": "",
+        "after": "AND (p.PlayedTime < ? OR (p.PlayedTime = ? AND p.id < ?))",
+    },
+)
+
+BEST_PLAY = register(
+    "best_play",
+    """
+                SELECT TOP (?) m.NoteLevel,
+                             m.MusicCode
+                  FROM dbo.O2JamHighscore AS h
+             LEFT JOIN dbo.o2jam_music_data AS m ON m.MusicCode = h.MusicCode AND m.Difficulty = 2
+                 WHERE h.PlayerCode = ?
+                   AND h.Progress <= ?
+                   AND h.Difficulty = 2
+                   {view}
+                 ORDER BY m.NoteLevel DESC
+            """,
+    view={"cleared": "AND isClear = 1", "any": ""},
+)
+
+# Summed from the daily rollup of dbo.rollup_playcounts, plus the snapshots
+# taken since its last run.
+PLAY_COUNT_RANKING = register(
+    "play_count_ranking",
+    """
+        SET NOCOUNT ON;
+
+        DECLARE @Top INT = ?;
+        DECLARE @StartDate DATE = ?;
+        DECLARE @EndDate DATE = ?;
+        DECLARE @RolledUpUntil DATETIME = (SELECT MAX(last_timestamp) FROM dbo.O2JamPlaycountRollupState);
+
+        WITH Tail AS (
+            SELECT chart_id, chart_difficulty, timestamp, playcount, 0 AS is_seed
+            FROM dbo.O2JamPlaycounts
+            WHERE @RolledUpUntil IS NULL OR timestamp > @RolledUpUntil
+            UNION ALL
+            SELECT chart_id, chart_difficulty, last_timestamp, last_playcount, 1
+            FROM dbo.O2JamPlaycountRollupState
+        ),
+        TailDeltas AS (
+            SELECT
+                chart_id,
+                chart_difficulty,
+                CAST(timestamp AS DATE) AS play_date,
+                is_seed,
+                playcount - LAG(playcount) OVER (PARTITION BY chart_id, chart_difficulty ORDER BY timestamp) AS delta
+            FROM Tail
+        ),
+        PlaycountDifference AS (
+            SELECT
+                chart_id,
+                chart_difficulty,
+                SUM(playcount) AS playcount_diff
+            FROM (
+                SELECT chart_id, chart_difficulty, playcount
+                FROM dbo.O2JamPlaycountDaily
+                WHERE play_date BETWEEN @StartDate AND @EndDate
+                UNION ALL
+                SELECT chart_id, chart_difficulty, delta
+                FROM TailDeltas
+                WHERE is_seed = 0 AND delta IS NOT NULL AND play_date BETWEEN @StartDate AND @EndDate
+            ) AS counted
+            GROUP BY chart_id, chart_difficulty
+        )
+        SELECT TOP (COALESCE(@Top, 2147483647))
+            p.chart_id,
+            p.playcount_diff AS total_playcount,
+            mi.NoteLevel,
+            ROW_NUMBER() OVER (ORDER BY p.playcount_diff DESC, mi.NoteLevel DESC) AS Rank
+        FROM PlaycountDifference AS p
+        JOIN dbo.o2jam_music_data AS mi ON mi.MusicCode = p.chart_id AND mi.Difficulty = p.chart_difficulty
+        WHERE p.playcount_diff > 0
+        ORDER BY Rank;
+        """,
+)
+
+# (expression, descending) pairs ordering a chart scoreboard, also the
+# columns a continuation token seeks past.
+CHART_RECORD_ORDER = (
+    ("h.Score", True),
+    ("h.isClear", True),
+    ("h.Cool", True),
+    ("ISNULL(s.Clear, -1)", False),
+    ("h.PlayedTime", True),
+    ("h.PlayerCode", True),
+)
+
+_CHART_RECORD_ORDER_QUERY = ", ".join(
+    f"{expression} {'DESC' if descending else 'ASC'}"
+    for expression, descending in CHART_RECORD_ORDER
+)
+
+CHART_TOP_RECORDS = register(
+    "chart_top_records",
+    f"""
+                SELECT
+                    h.PlayerCode,
+                    c.USER_NICKNAME,
+                    h.Cool,
+                    h.Good,
+                    h.Bad,
+                    h.Miss,
+                    h.MaxCombo,
+                    h.Score,
+                    h.isClear,
+                    h.PlayedTime,
+                    h.Progress,
+                    h.PatternOrder,
+                    ROUND(h.PlaySpeedRate, 3) AS PlaySpeedRate,
+                    h.PlayTimingRate,
+                    h.FLNOption,
+                    h.SLNOption,
+                    h.isNLN,
+                    ROW_NUMBER() OVER (ORDER BY {_CHART_RECORD_ORDER_QUERY}) status,
+                    ISNULL(s.Clear, -1)
+                FROM
+                    dbo.O2JamHighscore h
+                    LEFT OUTER JOIN dbo.T_o2jam_charinfo c on h.PlayerCode = c.USER_INDEX_ID
+                    LEFT OUTER JOIN dbo.O2JamStatus s ON h.PlayerCode = s.PlayerCode
+                WHERE
+                    h.MusicCode = ?
+                    AND h.Difficulty = ?
+                    {{seek}}
+                ORDER BY {_CHART_RECORD_ORDER_QUERY}
+                {{page}}
+            """,
+    seek={
+        "none": "",
+        "after": "AND " + seek_condition(CHART_RECORD_ORDER, [None] * 6)[0],
+    },
+    # offset : offset and page size, next : page size
+    page={
+        "all": "",
+        "offset": "OFFSET ? ROWS FETCH NEXT ? ROWS ONLY",
+        "next": "OFFSET 0 ROWS FETCH NEXT ? ROWS ONLY",
+    },
+)
+
+# Every optional part of the profile is one more result set after the
+# character row, so a projection only pays for the parts it asks for.
+PLAYER_PROFILE = register(
+    "player_profile",
+    """
+                SET NOCOUNT ON;
+
+                DECLARE @PlayerId INT = ?;
+
+                SELECT
+                    USER_NICKNAME,
+                    Level,
+                    Battle,
+                    AdminLevel,
+                    USER_INDEX_ID,
+                    LastAccess
+                FROM
+                    dbo.T_o2jam_charinfo
+                WHERE
+                    USER_INDEX_ID = @PlayerId;
+                {clear_count}{nickname_history}{badge_info}{clear_history}
+            """,
+    clear_count={
+        False: "",
+        True: """
+                SELECT
+                    COUNT(*)
+                FROM
+                    dbo.O2JamHighscore
+                WHERE
+                    PlayerCode = @PlayerId AND isClear=1 AND Difficulty=2;
+                """,
+    },
+    nickname_history={
+        False: "",
+        True: """
+                SELECT
+                    Nickname
+                FROM
+                    dbo.nickname_history
+                WHERE
+                    player_id = @PlayerId;
+                """,
+    },
+    badge_info={
+        False: "",
+        True: """
+                SELECT
+                    b.badge_name,
+                    b.badge_css_tag,
+                    h.MusicCode
+                FROM
+                    dbo.player_badge AS b
+                INNER JOIN
+                    dbo.O2JamHighscore AS h ON b.chart_id = h.MusicCode
+                INNER JOIN
+                    dbo.o2jam_music_data AS md ON md.MusicCode = h.MusicCode AND md.Difficulty = h.Difficulty
+                WHERE
+                    h.isClear = 1 AND h.Difficulty = 2 AND h.PlayerCode = @PlayerId
+                ORDER BY
+                    b.badge_priority;
+                """,
+    },
+    clear_history={
+        False: "",
+        True: """
+                SELECT
+                    CONVERT(char(10), date, 23), level
+                FROM
+                    status_clear_history
+                WHERE
+                    date >= CAST(DATEADD(day, -60, GETDATE()) AS DATE)
+                    AND player_id = @PlayerId
+                ORDER BY
+                    date;
+                """,
+    },
+)
+
+# Row number of a player's record on a chart board, the same position
+# CHART_TOP_RECORDS gives it, ties included.
+CHART_RECORD_POSITION = register(
+    "chart_record_position",
+    f"""
+                SELECT
+                    r.position
+                FROM (
+                    SELECT
+                        h.PlayerCode,
+                        ROW_NUMBER() OVER (ORDER BY {_CHART_RECORD_ORDER_QUERY}) position
+                    FROM
+                        dbo.O2JamHighscore h
+                        LEFT OUTER JOIN dbo.O2JamStatus s ON h.PlayerCode = s.PlayerCode
+                    WHERE
+                        h.MusicCode = ?
+                        AND h.Difficulty = ?
+                ) r
+                WHERE
+                    r.PlayerCode = ?
+            """,
+)
@@ -1,6 +1,11 @@
-import re
 from enum import Enum
+from functools import partial
 
+from src.database.chart_search_index import chart_search_index
+from src.database.id_cache import member_ids, nickname_ids, nickname_key
+from src.database.memo import memoized
+from src.database.player_name_index import player_name_index
+from src.database.ranking_index import player_ranking_snapshot
 from src.tools.encrypt import make_new_password_token, make_email_auth_token
 from src.tools.input_validator import InputValidator
 
@@ -18,66 +23,23 @@ class DatabaseUtils:
         self._trade_connection = trade_connection
 
     def search_chart(self, search_data):
-        def escape_like(s):
-            def escape_brackets(match):
-                return "[" + "".join(f"[{c}]" for c in match.group(1)) + "]"
+        chart_search_index.ensure_fresh(self._connection)
+        return chart_search_index.search(search_data)
 
-            s = re.sub(r"\[([^\]]+)\]", escape_brackets, s)
-            return s.replace("%", "[%]").replace("_", "[_]")
+    def iter_search_chart(self, search_data):
+        chart_search_index.ensure_fresh(self._connection)
+        yield from chart_search_index.search(search_data)
 
-        query = """
-                SELECT meta.MusicCode,
-                       Title,
-                       Artist,
-                       NoteCharter,
-                       BPM,
-                       data.NoteLevel
-                FROM dbo.o2jam_music_metadata meta
-                         RIGHT OUTER JOIN (SELECT MusicCode, NoteLevel
-                                           FROM dbo.o2jam_music_data
-                                           WHERE Difficulty = 2) data ON data.MusicCode = meta.MusicCode
-                WHERE data.NoteLevel BETWEEN ? AND ? \
-                """
-
-        params = [
-            search_data["options"]["level"][0],
-            search_data["options"]["level"][1],
-        ]
-
-        search_fields = ["Title", "Artist", "NoteCharter"]
-        search_conditions = [
-            f"{field} LIKE ?"
-            for field, enabled in zip(
-                search_fields,
-                [
-                    search_data["options"]["title"],
-                    search_data["options"]["artist"],
-                    search_data["options"]["mapper"],
-                ],
-            )
-            if enabled
-        ]
+    def suggest_chart(self, search_data, limit):
+        chart_search_index.ensure_fresh(self._connection)
+        return chart_search_index.suggest(search_data, limit)
 
-        if search_conditions:
-            query += " AND (" + " OR ".join(search_conditions) + ")"
-            escaped_keyword = escape_like(search_data["keywords"])
-            params.extend([f"%{escaped_keyword}%"] * len(search_conditions))
+    def find_player(self, keyword, limit):
+        # Tier and rank come from the player ranking snapshot.
+        player_name_index.ensure_fresh(self._connection)
+        player_ranking_snapshot.ensure_fresh(self._connection)
 
-        query += " ORDER BY data.NoteLevel DESC"
-
-        with self._connection.cursor() as cursor:
-            cursor.execute(query, params)
-            return [
-                {
-                    "music_code": code,
-                    "title": title,
-                    "artist": artist,
-                    "note_charter": charter,
-                    "bpm": round(float(bpm), 2),
-                    "hard_level": level,
-                }
-                for code, title, artist, charter, bpm, level in cursor.fetchall()
-            ]
+        return player_name_index.search(keyword, limit)
 
     def get_online_players(self):
         with self._connection.cursor() as cursor:
@@ -243,6 +205,29 @@ class DatabaseUtils:
             }
 
     def nickname_to_usercode(self, nickname):
+        key = nickname_key(nickname)
+        load = partial(self._load_nickname_usercode, nickname)
+        player_id = nickname_ids.get(key, load)
+
+        # Renames made by other processes only reach this one through the
+        # name index, so a cached id whose player went by another nickname
+        # since is looked up again.
+        if player_id is not None and not self._still_named(player_id, key):
+            nickname_ids.invalidate(key)
+            player_id = nickname_ids.get(key, load)
+
+        if player_id is None:
+            return -1
+
+        return player_id
+
+    def _still_named(self, player_id, key):
+        player_name_index.ensure_fresh(self._connection)
+        nickname = player_name_index.current_nickname(player_id)
+
+        return nickname is None or nickname_key(nickname) == key
+
+    def _load_nickname_usercode(self, nickname):
         with self._connection.cursor() as cursor:
             cursor.execute(
                 """
@@ -253,12 +238,7 @@ class DatabaseUtils:
                 nickname,
             )
 
-            player_id = cursor.fetchval()
-
-            if player_id is None:
-                return -1
-
-            return player_id
+            return cursor.fetchval()
 
     def generate_login_token(self, username, password):
         with self._connection.cursor() as cursor:
@@ -296,6 +276,7 @@ class DatabaseUtils:
 
             return new_token
 
+    @memoized
     def get_player_email(self, username):
         with self._connection.cursor() as cursor:
             cursor.execute("SELECT email FROM dbo.member WHERE userid=?", username)
@@ -428,6 +409,11 @@ class DatabaseUtils:
             return account_id
 
     def convert_member_id_to_player_id(self, member_id):
+        return member_ids.get(
+            member_id, lambda: self._load_member_player_id(member_id)
+        )
+
+    def _load_member_player_id(self, member_id):
         query = """
                 SELECT c.USER_INDEX_ID
                 FROM T_o2jam_charinfo AS c
@@ -0,0 +1,119 @@
+import datetime
+
+from src.database.chart_search_index import chart_search_index
+from src.database.player_name_index import player_name_index
+from src.database.ranking_index import (
+    player_ranking_index,
+    player_ranking_snapshot,
+    song_rank_index,
+)
+from src.database.reference_catalog import reference_catalog
+
+
+class VersionManager:
+    """Cheap markers that change whenever the data behind a page changes.
+
+    They are compared instead of running the page queries, so a marker must
+    cover everything the page shows."""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def get_player_version(self, player_id):
+        with self._connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SET NOCOUNT ON;
+
+                DECLARE @PlayerId INT = ?;
+
+                SELECT
+                    (SELECT MAX(PlayedTime) FROM dbo.O2JamPlaylog WHERE PlayerCode = @PlayerId),
+                    (SELECT UpdatedTime FROM dbo.O2JamStatus WHERE PlayerCode = @PlayerId),
+                    (
+                        SELECT CHECKSUM(USER_NICKNAME, Level, Battle, AdminLevel, LastAccess)
+                        FROM dbo.T_o2jam_charinfo
+                        WHERE USER_INDEX_ID = @PlayerId
+                    );
+            """,
+                player_id,
+            )
+
+            version = tuple(cursor.fetchone())
+
+        # Ranks shown next to the player's records move with everyone else's.
+        player_ranking_index.ensure_fresh(self._connection)
+        song_rank_index.ensure_fresh(self._connection)
+        # So are the chart titles, levels and progress names.
+        reference_catalog.ensure_fresh(self._connection)
+
+        # Recent records and the clear history are windows ending today.
+        return (
+            *version,
+            player_ranking_index.generation,
+            song_rank_index.generation,
+            reference_catalog.generation,
+            datetime.date.today(),
+        )
+
+    def get_chart_version(self, music_id, gauge_difficulty):
+        with self._connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SET NOCOUNT ON;
+
+                DECLARE @MusicCode INT = ?;
+                DECLARE @Difficulty INT = ?;
+
+                SELECT
+                    (
+                        SELECT MAX(PlayedTime)
+                        FROM dbo.O2JamHighscore
+                        WHERE MusicCode = @MusicCode AND Difficulty = @Difficulty
+                    ),
+                    (
+                        SELECT COUNT(*)
+                        FROM dbo.O2JamHighscore
+                        WHERE MusicCode = @MusicCode AND Difficulty = @Difficulty
+                    );
+            """,
+                (music_id, gauge_difficulty),
+            )
+
+            version = tuple(cursor.fetchone())
+
+        # The chart details and progress names are served from the catalog,
+        # so its copy is what the page shows.
+        reference_catalog.ensure_fresh(self._connection)
+        # The board shows the players' current nicknames and breaks score
+        # ties by their clear counts, which change without a new score.
+        player_name_index.ensure_fresh(self._connection)
+        player_ranking_snapshot.ensure_fresh(self._connection)
+
+        return (
+            *version,
+            reference_catalog.music_info(music_id, gauge_difficulty),
+            reference_catalog.generation,
+            player_name_index.generation,
+            player_ranking_snapshot.generation,
+        )
+
+    def get_play_count_version(self):
+        with self._connection.cursor() as cursor:
+            cursor.execute("SELECT MAX(timestamp) FROM dbo.O2JamPlaycounts")
+            last_snapshot = cursor.fetchval()
+
+        reference_catalog.ensure_fresh(self._connection)
+
+        # The default range ends today.
+        return last_snapshot, reference_catalog.generation, datetime.date.today()
+
+    def get_chart_search_version(self):
+        chart_search_index.ensure_fresh(self._connection)
+
+        return chart_search_index.generation
+
+    def get_player_ranking_version(self):
+        player_ranking_snapshot.ensure_fresh(self._connection)
+
+        return player_ranking_snapshot.generation
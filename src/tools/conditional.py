@@ -0,0 +1,49 @@
+import hashlib
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+def conditional(get_version, max_age=None):
+    # Sends an ETag derived from a data version marker, and answers a
+    # matching If-None-Match with 304 before the view runs any page query.
+    # get_version : callable taking the view arguments, returning the marker
+    #               or None when the response should not be validated.
+    # max_age : seconds clients may reuse the response without asking again,
+    #           otherwise they revalidate on every use.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version = get_version(*args, **kwargs)
+
+            if version is None:
+                return view(*args, **kwargs)
+
+            etag = make_etag(request.full_path, request.headers.get("Accept"), version)
+
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.vary.add("Accept")
+            response.cache_control.public = True
+
+            if max_age:
+                response.cache_control.max_age = max_age
+            else:
+                response.cache_control.no_cache = True
+
+            return response
+
+        return wrapper
+
+    return decorator
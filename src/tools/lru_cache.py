@@ -0,0 +1,44 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LruCache:
+    """Keeps the max_size most recently used values, each for ttl seconds.
+
+    A load returning None is remembered too, for negative_ttl seconds, so
+    lookups of unknown keys stop reaching the database as well."""
+
+    def __init__(self, max_size, ttl, negative_ttl):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        # load : callable computing the value, only called on a miss
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                return entry[0]
+
+        value = load()
+        ttl = self._negative_ttl if value is None else self._ttl
+
+        with self._lock:
+            self._entries[key] = (value, now + ttl)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
@@ -0,0 +1,38 @@
+import unicodedata
+
+# Grams up to this length are indexed, longer keywords are looked up by
+# every gram of this length they contain.
+GRAM_LENGTH = 2
+
+
+def text_grams(text):
+    # Distinct 1 and 2 character grams, which covers Hangul and kana as
+    # well as Latin text without any word splitting.
+    grams = set(text)
+    grams.update(text[i : i + GRAM_LENGTH] for i in range(len(text) - 1))
+
+    return grams
+
+
+def keyword_grams(keyword):
+    if len(keyword) < GRAM_LENGTH:
+        return {keyword}
+
+    return {
+        keyword[i : i + GRAM_LENGTH] for i in range(len(keyword) - GRAM_LENGTH + 1)
+    }
+
+
+# Katakana to the hiragana of the same sound, the server collation
+# (Korean_Wansung_CI_AS) is kana insensitive.
+_KANA_FOLDING = {
+    code: code - 0x60
+    for code in (*range(0x30A1, 0x30F7), 0x30FD, 0x30FE)
+}
+
+
+def fold(text):
+    # Text as the server collation compares it: case, width (NFKC turns
+    # full width Latin and half width katakana into the usual forms) and
+    # kana insensitive, accent sensitive.
+    return unicodedata.normalize("NFKC", text).casefold().translate(_KANA_FOLDING)
@@ -0,0 +1,59 @@
+import base64
+import binascii
+import datetime
+import json
+
+
+class RecordPage(list):
+    """A page of records that also carries the token for the following page."""
+
+    def __init__(self, records=(), next_cursor=None):
+        super().__init__(records)
+        self.next_cursor = next_cursor
+
+
+def seek_condition(order_columns, values):
+    # order_columns : [(expression, descending)] in ORDER BY order.
+    # Returns the SQL condition and parameters matching rows ordered after values.
+    clauses = []
+    params = []
+
+    for index, (expression, descending) in enumerate(order_columns):
+        terms = [f"{column} = ?" for column, _ in order_columns[:index]]
+        terms.append(f"{expression} {'<' if descending else '>'} ?")
+        clauses.append("(" + " AND ".join(terms) + ")")
+        params.extend(values[: index + 1])
+
+    return "(" + " OR ".join(clauses) + ")", params
+
+
+def encode_cursor(values):
+    payload = json.dumps(
+        [
+            {"datetime": value.isoformat()}
+            if isinstance(value, datetime.datetime)
+            else value
+            for value in values
+        ],
+        separators=(",", ":"),
+    )
+
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token, size):
+    try:
+        payload = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(payload)
+
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError
+
+        return [
+            datetime.datetime.fromisoformat(value["datetime"])
+            if isinstance(value, dict)
+            else value
+            for value in values
+        ]
+    except (binascii.Error, KeyError, TypeError, ValueError) as error:
+        raise ValueError(f"Invalid cursor: {token}") from error
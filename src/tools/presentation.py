@@ -0,0 +1,33 @@
+from functools import lru_cache
+
+# Managers return native datetimes, the pages format them with these filters
+# and the API sends them as ISO 8601 (records.encode_default).
+
+
+@lru_cache(maxsize=4096)
+def _format_minute(value, date_format):
+    # Same text as SQL Server's FORMAT(value, '... hh:mm tt', 'en-US'),
+    # without depending on the process locale for AM/PM.
+    return f"{value.strftime(date_format)} {'PM' if value.hour >= 12 else 'AM'}"
+
+
+def format_datetime(value, default=""):
+    # 2024-01-31 09:05 PM, like the scoreboards always showed.
+    if value is None:
+        return default
+
+    # Records of the same minute share one formatted string.
+    return _format_minute(value.replace(second=0, microsecond=0), "%Y-%m-%d %I:%M")
+
+
+def format_short_datetime(value, default=""):
+    # 24/01/31 09:05 PM
+    if value is None:
+        return default
+
+    return _format_minute(value.replace(second=0, microsecond=0), "%y/%m/%d %I:%M")
+
+
+def register_filters(app):
+    app.add_template_filter(format_datetime, "datetime")
+    app.add_template_filter(format_short_datetime, "short_datetime")
@@ -0,0 +1,30 @@
+from src.tools.pagination import RecordPage
+
+
+class RecordTable:
+    """Records of one query, all of the same record type."""
+
+    def __init__(self, record_class, records=(), next_cursor=None):
+        self.columns = record_class.FIELDS
+        self.records = list(records)
+        self.next_cursor = next_cursor
+
+    def __len__(self):
+        return len(self.records)
+
+    def to_records(self):
+        return RecordPage(self.records, self.next_cursor)
+
+    def to_row_arrays(self):
+        return {
+            "columns": list(self.columns),
+            "rows": [record.to_row() for record in self.records],
+        }
+
+    def to_column_arrays(self):
+        if not self.records:
+            return {column: [] for column in self.columns}
+
+        rows = [record.to_row() for record in self.records]
+
+        return {column: list(values) for column, values in zip(self.columns, zip(*rows))}
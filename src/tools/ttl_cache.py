@@ -0,0 +1,46 @@
+import threading
+import time
+
+
+class TtlCache:
+    """Keeps one loaded value per key for a fixed number of seconds.
+
+    Concurrent misses of the same key wait for a single load instead of
+    each running it."""
+
+    def __init__(self, ttl):
+        self._ttl = ttl
+        self._entries = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        # load : callable computing the value, only called on a miss
+        value = self._get_fresh(key)
+
+        if value is not None:
+            return value
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Whoever waited here finds the value the first caller loaded.
+            value = self._get_fresh(key)
+
+            if value is None:
+                value = load()
+                self._entries[key] = (value, time.monotonic() + self._ttl)
+
+            return value
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def _get_fresh(self, key):
+        entry = self._entries.get(key)
+
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+
+        return entry[0]